@@ -1,10 +1,29 @@
 import logging
+from typing import Optional
+
+from utils.cache import interfaces as cache_interfaces
 from .models import User
 from . import interfaces
 logger = logging.getLogger(__name__)
 
+USER_NOT_FOUND = 'user_not_found'
+
 
 class AccountService(interfaces.AbstractAccountService):
+    def __init__(
+            self,
+            user_claim_cache: Optional[cache_interfaces.AbstractCache] = None,
+            user_claim_timeout: int = 24 * 60 * 60,
+            user_not_found_timeout: int = 60,
+    ):
+        """
+            user_claim_cache keeps the claims of telegram ids, and for user_not_found_timeout seconds the ids
+            without a user too, so unregistered chats do not query User on every message
+        """
+        self.user_claim_cache = user_claim_cache
+        self.user_claim_timeout = user_claim_timeout
+        self.user_not_found_timeout = user_not_found_timeout
+
     def register_new_user(self, user: interfaces.UserInfo):
         logger.info(f'user: {user}')
         if user.telegram_id:
@@ -27,19 +46,41 @@ class AccountService(interfaces.AbstractAccountService):
             is_staff=False
         )
         new_user.save()
+        self._invalidate_user_claim(new_user.telegram_id)
         result = self._convert_user_to_user_info(new_user)
         logger.info(f'result: {result}')
 
     async def telegram_authentication(self, telegram_id) -> interfaces.UserClaim:
         logger.info(f"telegram_id: {telegram_id}")
+        if self.user_claim_cache:
+            result = await self.user_claim_cache.aget(self._get_user_claim_cache_key(telegram_id))
+            if result == USER_NOT_FOUND:
+                logger.info(f"No user found with Telegram ID {telegram_id}, cached")
+                raise interfaces.UserNotFound(f"No user found with Telegram ID {telegram_id}")
+            if result is not None:
+                return result
         try:
             account = await User.objects.aget(telegram_id=telegram_id)
             result = interfaces.UserClaim(username= account.username, telegram_id=account.telegram_id)
             logger.info(f'result: {result}')
-            return result
         except User.DoesNotExist:
             logger.info(f"No user found with Telegram ID {telegram_id}")
+            if self.user_claim_cache:
+                await self.user_claim_cache.aset(
+                    self._get_user_claim_cache_key(telegram_id), USER_NOT_FOUND, timeout=self.user_not_found_timeout)
             raise interfaces.UserNotFound(f"No user found with Telegram ID {telegram_id}")
+        if self.user_claim_cache:
+            await self.user_claim_cache.aset(
+                self._get_user_claim_cache_key(telegram_id), result, timeout=self.user_claim_timeout)
+        return result
+
+    def _invalidate_user_claim(self, telegram_id):
+        if self.user_claim_cache and telegram_id:
+            self.user_claim_cache.delete(self._get_user_claim_cache_key(telegram_id))
+
+    @staticmethod
+    def _get_user_claim_cache_key(telegram_id) -> str:
+        return f"user_claim_{telegram_id}"
 
 
     # def get_user_by_username(self, username) -> interfaces.UserClaim:
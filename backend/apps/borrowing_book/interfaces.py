@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Set
 
 from apps.account import interfaces as account_interfaces
 
@@ -17,6 +17,10 @@ class BorrowedBookNotFound(Exception):
     pass
 
 
+class InvalidCursor(Exception):
+    pass
+
+
 class AddBookInput(BaseModel):
     title: str
     writer: str
@@ -44,12 +48,29 @@ class BorrowBookOutput(BaseModel):
     id: int
     username: str
     book_title: str
-    borrowed_at: int
+    # the column is nullable
+    borrowed_at: int | None = None
     due_at: int
     return_at: int | None = None
     penalty: Optional[float] = None
 
 
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+
+
+class BookCursorPage(BaseModel):
+    results: List[AddBookOutput]
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+
+class BorrowedBookCursorPage(BaseModel):
+    results: List[BorrowBookOutput]
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+
 class BookFilter(BaseModel):
     title: Optional[str] = None
     writer: Optional[str] = None
@@ -105,10 +126,30 @@ class AbstractLibraryFacade(ABC):
     def get_books(self, filters: BookFilter) -> List[AddBookOutput]:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_books_by_cursor(self, filters: BookFilter, limit: int, cursor: Optional[str] = None) -> BookCursorPage:
+        """
+            keyset pagination on (title, id). cursor is one of next_cursor or previous_cursor of a returned page,
+            None returns the first page. the cost of a page does not depend on its depth.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_borrowed_books(self, filters: BorrowedBookFilter) -> List[BorrowBookOutput]:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_borrowed_books_by_cursor(
+            self,
+            filters: BorrowedBookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> BorrowedBookCursorPage:
+        """
+            keyset pagination on (borrowed_at, id), see get_books_by_cursor
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def return_book(
             self,
@@ -130,15 +171,67 @@ class AbstractLibraryFacade(ABC):
     ) -> BorrowBookOutput:
         raise NotImplementedError
 
+    @abstractmethod
+    def titles_borrowed_by(self, user_claim: account_interfaces.UserClaim, titles: List[str]) -> Set[str]:
+        """
+            returns the titles, among the given ones, that the user has borrowed and not returned yet
+        """
+        raise NotImplementedError
+
     def has_user_borrowed_book(self, user_claim: account_interfaces.UserClaim, book_title) -> bool:
-        if len(
-                self.get_borrowed_books(
-                    BorrowedBookFilter(
-                        username=user_claim.username,
-                        book_title=book_title,
-                        return_at__isnull=True
-                    )
-                )
-        ) > 0:
-            return True
-        return False
+        return book_title in self.titles_borrowed_by(user_claim, [book_title])
+
+
+class AbstractAsyncLibraryFacade(AbstractLibraryFacade):
+    """
+        async counterparts of the library facade methods for callers running in an event loop, like the bot
+    """
+
+    @abstractmethod
+    async def aget_books(self, filters: BookFilter) -> List[AddBookOutput]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def aget_books_by_cursor(
+            self,
+            filters: BookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> BookCursorPage:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def aget_borrowed_books(self, filters: BorrowedBookFilter) -> List[BorrowBookOutput]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def aget_borrowed_books_by_cursor(
+            self,
+            filters: BorrowedBookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> BorrowedBookCursorPage:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def aget_book_by_title(self, book_title: str) -> BookInfo:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def aget_borrowed_book_by_id(self, id: int) -> BorrowBookOutput:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def atitles_borrowed_by(self, user_claim: account_interfaces.UserClaim, titles: List[str]) -> Set[str]:
+        raise NotImplementedError
+
+    async def ahas_user_borrowed_book(self, user_claim: account_interfaces.UserClaim, book_title) -> bool:
+        return book_title in await self.atitles_borrowed_by(user_claim, [book_title])
+
+    @abstractmethod
+    async def aborrow_book(self, input_data: BorrowBookInput, penalty_rate_per_day=0.5) -> BorrowBookOutput:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def areturn_book(self, input_data: ReturnBookInput, penalty_rate_per_day=0.5) -> ReturnBookOutput:
+        raise NotImplementedError
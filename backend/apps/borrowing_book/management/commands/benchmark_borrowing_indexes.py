@@ -0,0 +1,87 @@
+import logging
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from apps.borrowing_book.models import Book, BorrowedBook
+
+logger = logging.getLogger(__name__)
+
+NO_INDEXES_MIGRATION = '0002_remove_borrowedbook_borrowed_date_and_more'
+BATCH_SIZE = 10000
+# columns that exist in every measured schema, model instances would also select the later book and user columns
+BOOK_COLUMNS = ('id', 'title', 'writer', 'quantity')
+BORROWED_BOOK_COLUMNS = ('id', 'username', 'book_title', 'borrowed_at', 'due_at', 'return_at')
+
+
+class Command(BaseCommand):
+    help = ('seeds book and borrowed book rows and prints query plans and latency of the hot lookups '
+            'without and with the borrowing_book indexes. run it against a disposable database only')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='rows of each table')
+        parser.add_argument('--repeat', type=int, default=50, help='runs of each query')
+        parser.add_argument('--skip-seed', action='store_true')
+
+    def handle(self, *args, **options):
+        # seeding writes through the current models
+        call_command('migrate', 'borrowing_book', verbosity=0)
+        if not options['skip_seed']:
+            self._seed(options['rows'])
+
+        call_command('migrate', 'borrowing_book', NO_INDEXES_MIGRATION, verbosity=0)
+        before = self._measure(options['rows'], options['repeat'])
+        call_command('migrate', 'borrowing_book', verbosity=0)
+        after = self._measure(options['rows'], options['repeat'])
+
+        for name in before:
+            self.stdout.write(f'\n=== {name}')
+            self.stdout.write(f'before: {before[name][0]:.3f} ms\n{before[name][1]}')
+            self.stdout.write(f'after: {after[name][0]:.3f} ms\n{after[name][1]}')
+
+    def _seed(self, rows: int):
+        for start in range(Book.objects.count(), rows, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, rows)
+            Book.objects.bulk_create([
+                Book(title=f'title {i}', writer=f'writer {i % 1000}', quantity=i % 5) for i in range(start, end)
+            ])
+        for start in range(BorrowedBook.objects.count(), rows, BATCH_SIZE):
+            end = min(start + BATCH_SIZE, rows)
+            BorrowedBook.objects.bulk_create([
+                BorrowedBook(
+                    username=f'user {i % 10000}',
+                    book_title=f'title {i}',
+                    borrowed_at=i * 1000,
+                    due_at=i * 1000 + 7 * 24 * 60 * 60 * 1000,
+                    return_at=None if i % 10 == 0 else i * 1000 + 1000,
+                ) for i in range(start, end)
+            ])
+        logger.info(f'seeded {rows} rows')
+
+    def _measure(self, rows: int, repeat: int) -> dict:
+        middle = rows // 2
+        queries = {
+            'book by title': Book.objects.filter(title=f'title {middle}').values(*BOOK_COLUMNS),
+            'books by writer': Book.objects.filter(writer='writer 500').values(*BOOK_COLUMNS),
+            'has user borrowed book': BorrowedBook.objects.filter(
+                username=f'user {middle % 10000}', book_title=f'title {middle}', return_at__isnull=True
+            ).values(*BORROWED_BOOK_COLUMNS),
+            'overdue borrowed books': BorrowedBook.objects.filter(
+                due_at__lt=10 * 60 * 60 * 1000, return_at__isnull=True
+            ).values(*BORROWED_BOOK_COLUMNS),
+            'books keyset page': Book.objects.filter(
+                title__gt=f'title {middle}'
+            ).order_by('title', 'id').values(*BOOK_COLUMNS)[:8],
+            'borrowed books keyset page': BorrowedBook.objects.filter(
+                borrowed_at__gt=middle * 1000
+            ).order_by('borrowed_at', 'id').values(*BORROWED_BOOK_COLUMNS)[:8],
+        }
+        result = {}
+        for name, queryset in queries.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            latency = (time.perf_counter() - started) * 1000 / repeat
+            result[name] = (latency, queryset.explain())
+        return result
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing_book', '0002_remove_borrowedbook_borrowed_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='title',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='writer',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='borrowedbook',
+            name='borrowed_at',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='borrowedbook',
+            name='due_at',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbook',
+            index=models.Index(fields=['username', 'book_title', 'return_at'], name='borrowed_book_user_title_idx'),
+        ),
+    ]
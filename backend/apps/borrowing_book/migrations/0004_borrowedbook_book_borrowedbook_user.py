@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_book_and_user(apps, schema_editor):
+    Book = apps.get_model('borrowing_book', 'Book')
+    BorrowedBook = apps.get_model('borrowing_book', 'BorrowedBook')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    # rows whose title or username no longer matches keep a null reference
+    BorrowedBook.objects.update(
+        book_id=Subquery(Book.objects.filter(title=OuterRef('book_title')).order_by('id').values('id')[:1]),
+        user_id=Subquery(User.objects.filter(username=OuterRef('username')).values('id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('borrowing_book', '0003_alter_book_title_alter_book_writer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowedbook',
+            name='book',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='borrowed_books', to='borrowing_book.book'),
+        ),
+        migrations.AddField(
+            model_name='borrowedbook',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='borrowed_books', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_book_and_user, migrations.RunPython.noop),
+    ]
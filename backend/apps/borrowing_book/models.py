@@ -1,10 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
 
 class Book(models.Model):
-    title = models.CharField(max_length=255)
-    writer = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, db_index=True)
+    writer = models.CharField(max_length=255, db_index=True)
     quantity = models.PositiveIntegerField(default=0)
     topic = models.CharField(max_length=100, null=True, blank=True)
     publisher = models.CharField(max_length=255, null=True, blank=True)
@@ -15,11 +16,19 @@ class Book(models.Model):
 
 
 class BorrowedBook(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, related_name='borrowed_books')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                             related_name='borrowed_books')
     username = models.CharField(max_length=150)
     book_title = models.CharField(max_length=255)
-    borrowed_at = models.BigIntegerField(null=True)
+    borrowed_at = models.BigIntegerField(null=True, db_index=True)
     return_at = models.BigIntegerField(null=True)
-    due_at = models.BigIntegerField(null=True)
+    due_at = models.BigIntegerField(null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['username', 'book_title', 'return_at'], name='borrowed_book_user_title_idx'),
+        ]
 
     def __str__(self):
         return f'{self.book_title} borrowed by {self.username}'
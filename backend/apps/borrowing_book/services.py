@@ -1,9 +1,14 @@
 import logging
 from datetime import datetime
-from typing import List, override
+from typing import List, Optional, Set, override
 
-from django.db import transaction
+from asgiref.sync import sync_to_async
 
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import F, IntegerField, Q
+
+from apps.account import interfaces as account_interfaces
 from utils.date_time import interfaces as date_time_interfaces
 
 from .models import Book, BorrowedBook
@@ -61,11 +66,12 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
         try:
             with transaction.atomic():
                 logger.info(f"Borrowing book with data: {input_data}")
-                book = Book.objects.get(title=input_data.book_title)
-                if book.quantity > 0:
-                    book.quantity -= 1
-                    book.save()
+                book_id = Book.objects.values_list('id', flat=True).get(title=input_data.book_title)
+                # a single conditional UPDATE, concurrent borrows of the last copy can not both succeed
+                if Book.objects.filter(id=book_id, quantity__gt=0).update(quantity=F('quantity') - 1):
                     borrowed_book = BorrowedBook.objects.create(
+                        book_id=book_id,
+                        user=get_user_model().objects.filter(username=input_data.username).first(),
                         username=input_data.username,
                         book_title=input_data.book_title,
                         borrowed_at=self.date_time_utils.get_current_timestamp(),
@@ -82,7 +88,7 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
                     raise interfaces.BookNotAvailableException("Book is not available")
         except Book.DoesNotExist:
             logger.info(f'Book: {input_data.book_title} Not found')
-            interfaces.BookNotFound(f'Book: {input_data.book_title} Not found')
+            raise interfaces.BookNotFound(f'Book: {input_data.book_title} Not found')
 
         except Exception as e:
             logger.error(f"Failed to borrow book: {str(e)}")
@@ -91,47 +97,43 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
     def get_books(self, filters: interfaces.BookFilter) -> List[interfaces.AddBookOutput]:
         try:
             logger.info(f"Fetching books with filters: {filters}")
-            books = Book.objects.all()
-
-            if filters.title:
-                books = books.filter(title__contains=filters.title)
-            if filters.writer:
-                books = books.filter(writer__contains=filters.writer)
-            if filters.topic:
-                books = books.filter(topic__contains=filters.topic)
-            if filters.publisher:
-                books = books.filter(publisher__contains=filters.publisher)
-            if filters.date_published:
-                books = books.filter(date_published=filters.date_published)
-
-            result = [
-                interfaces.AddBookOutput(
-                    id=book.id,
-                    title=book.title,
-                    quantity=book.quantity,
-                    topic=book.topic,
-                    publisher=book.publisher,
-                    date_published=str(book.date_published) if book.date_published else None
-                ) for book in books
-            ]
+            books = self._filter_books(filters)
+            result = [self._convert_book_to_dataclass(book) for book in books]
             logger.info(f"Books fetched: {result}")
             return result
         except Exception as e:
             logger.error(f"Failed to fetch books: {str(e)}")
             raise e
 
+    def get_books_by_cursor(
+            self,
+            filters: interfaces.BookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> interfaces.BookCursorPage:
+        try:
+            logger.info(f"Fetching books with filters: {filters}, limit: {limit}, cursor: {cursor}")
+            books, next_cursor, previous_cursor = self._get_keyset_page(
+                queryset=self._filter_books(filters),
+                sort_field='title',
+                limit=limit,
+                cursor=cursor,
+            )
+            result = interfaces.BookCursorPage(
+                results=[self._convert_book_to_dataclass(book) for book in books],
+                next_cursor=next_cursor,
+                previous_cursor=previous_cursor,
+            )
+            logger.info(f"Books page fetched: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Failed to fetch books page: {str(e)}")
+            raise e
+
     def get_borrowed_books(self, filters: interfaces.BorrowedBookFilter) -> List[interfaces.BorrowBookOutput]:
         try:
             logger.info(f"Fetching borrowed books with filters: {filters}")
-            borrowed_books = BorrowedBook.objects.all()
-
-            if filters.username:
-                borrowed_books = borrowed_books.filter(username=filters.username)
-            if filters.book_title:
-                borrowed_books = borrowed_books.filter(book_title=filters.book_title)
-            if filters.return_at__isnull:
-                borrowed_books = borrowed_books.filter(return_at__isnull=filters.return_at__isnull)
-
+            borrowed_books = self._filter_borrowed_books(filters)
             result = [
                 (
                     self._convert_borrowed_book_to_dataclass(borrowed_book)
@@ -143,24 +145,178 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
             logger.error(f"Failed to fetch borrowed books: {str(e)}")
             raise e
 
+    def get_borrowed_books_by_cursor(
+            self,
+            filters: interfaces.BorrowedBookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> interfaces.BorrowedBookCursorPage:
+        try:
+            logger.info(f"Fetching borrowed books with filters: {filters}, limit: {limit}, cursor: {cursor}")
+            borrowed_books, next_cursor, previous_cursor = self._get_keyset_page(
+                queryset=self._filter_borrowed_books(filters),
+                sort_field='borrowed_at',
+                limit=limit,
+                cursor=cursor,
+            )
+            result = interfaces.BorrowedBookCursorPage(
+                results=[self._convert_borrowed_book_to_dataclass(borrowed_book) for borrowed_book in borrowed_books],
+                next_cursor=next_cursor,
+                previous_cursor=previous_cursor,
+            )
+            logger.info(f"Borrowed books page fetched: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Failed to fetch borrowed books page: {str(e)}")
+            raise e
+
+    def titles_borrowed_by(self, user_claim: account_interfaces.UserClaim, titles: List[str]) -> Set[str]:
+        result = set(
+            BorrowedBook.objects.filter(
+                username=user_claim.username,
+                book_title__in=titles,
+                return_at__isnull=True
+            ).values_list('book_title', flat=True)
+        )
+        logger.info(f'result: {result}')
+        return result
+
+    def has_user_borrowed_book(self, user_claim: account_interfaces.UserClaim, book_title) -> bool:
+        return BorrowedBook.objects.filter(
+            username=user_claim.username,
+            book_title=book_title,
+            return_at__isnull=True
+        ).exists()
+
+    @classmethod
+    def _get_keyset_page(cls, queryset, sort_field: str, limit: int, cursor: Optional[str]):
+        """
+            the cursor carries the direction and the id of the edge row of the current page, and its sort key when
+            that is an integer. a text sort key would not fit in telegram callback data, it is looked up by primary
+            key instead, so that cursor fails with InvalidCursor once its row is deleted.
+            rows are seeked from (sort_field, id) instead of skipping an offset, nulls first.
+        """
+        direction, anchor_id, anchor = cls._parse_cursor(queryset, sort_field, cursor)
+        if anchor_id is not None and anchor is None:
+            anchor = queryset.model.objects.filter(id=anchor_id).values(sort_field).first()
+            cls._check_anchor(cursor, anchor)
+        direction, rows = cls._seek(queryset, sort_field, direction, anchor_id, anchor)
+        return cls._to_keyset_page(queryset, sort_field, list(rows[:limit + 1]), limit, direction, anchor)
+
+    @staticmethod
+    def _carries_sort_key(queryset, sort_field: str) -> bool:
+        return isinstance(queryset.model._meta.get_field(sort_field), IntegerField)
+
+    @classmethod
+    def _parse_cursor(cls, queryset, sort_field: str, cursor: Optional[str]):
+        """
+            returns the direction, the anchor id and the anchor, which is None when it has to be looked up
+        """
+        if cursor:
+            try:
+                anchor_id, _, sort_key = cursor[1:].partition(':')
+                if not cls._carries_sort_key(queryset, sort_field):
+                    return cursor[0], int(anchor_id), None
+                # an empty sort key is a null one
+                return cursor[0], int(anchor_id), {sort_field: int(sort_key) if sort_key else None}
+            except ValueError:
+                logger.info(f'invalid cursor: {cursor}')
+        return interfaces.CURSOR_NEXT, None, None
+
+    @staticmethod
+    def _check_anchor(cursor: str, anchor: Optional[dict]):
+        if anchor is None:
+            logger.info(f'row of cursor {cursor} not found')
+            raise interfaces.InvalidCursor('this page is no longer available, please open the list again')
+
+    @staticmethod
+    def _seek(queryset, sort_field: str, direction: str, anchor_id: Optional[int], anchor: Optional[dict]):
+        ascending = (F(sort_field).asc(nulls_first=True), 'id')
+        descending = (F(sort_field).desc(nulls_last=True), '-id')
+        if anchor is None:
+            return interfaces.CURSOR_NEXT, queryset.order_by(*ascending)
+        sort_key = anchor[sort_field]
+        if direction == interfaces.CURSOR_PREVIOUS:
+            if sort_key is None:
+                before = Q(**{f'{sort_field}__isnull': True, 'id__lt': anchor_id})
+            else:
+                before = (
+                    Q(**{f'{sort_field}__isnull': True})
+                    | Q(**{f'{sort_field}__lt': sort_key})
+                    | Q(**{sort_field: sort_key, 'id__lt': anchor_id})
+                )
+            return direction, queryset.filter(before).order_by(*descending)
+        if sort_key is None:
+            after = Q(**{f'{sort_field}__isnull': False}) | Q(**{f'{sort_field}__isnull': True, 'id__gt': anchor_id})
+        else:
+            after = Q(**{f'{sort_field}__gt': sort_key}) | Q(**{sort_field: sort_key, 'id__gt': anchor_id})
+        return direction, queryset.filter(after).order_by(*ascending)
+
+    @classmethod
+    def _to_keyset_page(cls, queryset, sort_field: str, rows: list, limit: int, direction: str,
+                        anchor: Optional[dict]):
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == interfaces.CURSOR_PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, anchor is not None
+
+        def get_cursor(direction: str, row) -> str:
+            if not cls._carries_sort_key(queryset, sort_field):
+                return f'{direction}{row.id}'
+            sort_key = getattr(row, sort_field)
+            return f'{direction}{row.id}:{"" if sort_key is None else sort_key}'
+
+        next_cursor = get_cursor(interfaces.CURSOR_NEXT, rows[-1]) if rows and has_next else None
+        previous_cursor = get_cursor(interfaces.CURSOR_PREVIOUS, rows[0]) if rows and has_previous else None
+        return rows, next_cursor, previous_cursor
+
+    @staticmethod
+    def _filter_books(filters: interfaces.BookFilter):
+        books = Book.objects.all()
+
+        if filters.title:
+            books = books.filter(title__contains=filters.title)
+        if filters.writer:
+            books = books.filter(writer__contains=filters.writer)
+        if filters.topic:
+            books = books.filter(topic__contains=filters.topic)
+        if filters.publisher:
+            books = books.filter(publisher__contains=filters.publisher)
+        if filters.date_published:
+            books = books.filter(date_published=filters.date_published)
+        return books
+
+    @staticmethod
+    def _filter_borrowed_books(filters: interfaces.BorrowedBookFilter):
+        borrowed_books = BorrowedBook.objects.all()
+
+        if filters.username:
+            borrowed_books = borrowed_books.filter(username=filters.username)
+        if filters.book_title:
+            borrowed_books = borrowed_books.filter(book_title=filters.book_title)
+        if filters.return_at__isnull:
+            borrowed_books = borrowed_books.filter(return_at__isnull=filters.return_at__isnull)
+        return borrowed_books
+
     def return_book(self, input_data: interfaces.ReturnBookInput,
                     penalty_rate_per_day=0.5) -> interfaces.ReturnBookOutput:
         try:
             with transaction.atomic():
                 logger.info(f"Returning book with data: {input_data}")
-                borrowed_book = BorrowedBook.objects.get(book_title=input_data.borrowed_book_title,
-                                                         username=input_data.username,
-                                                         return_at__isnull=True
-                                                         )
-                book = Book.objects.get(title=borrowed_book.book_title)
-
-                if book.quantity is not None:
-                    book.quantity += 1
-                    book.save()
+                borrowed_book = BorrowedBook.objects.get(
+                    book_title=input_data.borrowed_book_title,
+                    username=input_data.username,
+                    return_at__isnull=True
+                )
+                if not Book.objects.filter(id=borrowed_book.book_id).update(quantity=F('quantity') + 1):
+                    raise Book.DoesNotExist
 
                 # penalty = borrowed_book.calculate_penalty(penalty_rate_per_day)
                 borrowed_book.return_at = self.date_time_utils.get_current_timestamp()
-                borrowed_book.save()
+                borrowed_book.save(update_fields=['return_at'])
 
                 logger.info(f"Book returned: {borrowed_book}")
                 result = interfaces.ReturnBookOutput(
@@ -208,6 +364,17 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
         logger.info(f'result: {result}')
         return result
 
+    @staticmethod
+    def _convert_book_to_dataclass(book: Book) -> interfaces.AddBookOutput:
+        return interfaces.AddBookOutput(
+            id=book.id,
+            title=book.title,
+            quantity=book.quantity,
+            topic=book.topic,
+            publisher=book.publisher,
+            date_published=str(book.date_published) if book.date_published else None
+        )
+
     @staticmethod
     def _convert_book_to_book_info(book: Book) -> interfaces.BookInfo:
         return interfaces.BookInfo(
@@ -230,3 +397,146 @@ class LibraryFacade(interfaces.AbstractLibraryFacade):
             return_at=borrowed_book.return_at,
             due_at=borrowed_book.due_at,
         )
+
+
+class AsyncLibraryFacade(LibraryFacade, interfaces.AbstractAsyncLibraryFacade):
+    """
+        reads use the async ORM. borrow and return need a transaction, which the async ORM can not open, so
+        they run the sync methods in the default thread pool (thread_sensitive=False) instead of the single
+        shared sync thread, and borrows of different chats do not wait for each other.
+    """
+
+    @override
+    async def aget_books(self, filters: interfaces.BookFilter) -> List[interfaces.AddBookOutput]:
+        logger.info(f"Fetching books with filters: {filters}")
+        result = [self._convert_book_to_dataclass(book) async for book in self._filter_books(filters)]
+        logger.info(f"Books fetched: {result}")
+        return result
+
+    @override
+    async def aget_books_by_cursor(
+            self,
+            filters: interfaces.BookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> interfaces.BookCursorPage:
+        logger.info(f"Fetching books with filters: {filters}, limit: {limit}, cursor: {cursor}")
+        books, next_cursor, previous_cursor = await self._aget_keyset_page(
+            queryset=self._filter_books(filters),
+            sort_field='title',
+            limit=limit,
+            cursor=cursor,
+        )
+        result = interfaces.BookCursorPage(
+            results=[self._convert_book_to_dataclass(book) for book in books],
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
+        logger.info(f"Books page fetched: {result}")
+        return result
+
+    @override
+    async def aget_borrowed_books(self, filters: interfaces.BorrowedBookFilter) -> List[interfaces.BorrowBookOutput]:
+        logger.info(f"Fetching borrowed books with filters: {filters}")
+        result = [
+            self._convert_borrowed_book_to_dataclass(borrowed_book)
+            async for borrowed_book in self._filter_borrowed_books(filters)
+        ]
+        logger.info(f"Borrowed books fetched: {result}")
+        return result
+
+    @override
+    async def aget_borrowed_books_by_cursor(
+            self,
+            filters: interfaces.BorrowedBookFilter,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> interfaces.BorrowedBookCursorPage:
+        logger.info(f"Fetching borrowed books with filters: {filters}, limit: {limit}, cursor: {cursor}")
+        borrowed_books, next_cursor, previous_cursor = await self._aget_keyset_page(
+            queryset=self._filter_borrowed_books(filters),
+            sort_field='borrowed_at',
+            limit=limit,
+            cursor=cursor,
+        )
+        result = interfaces.BorrowedBookCursorPage(
+            results=[self._convert_borrowed_book_to_dataclass(borrowed_book) for borrowed_book in borrowed_books],
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
+        logger.info(f"Borrowed books page fetched: {result}")
+        return result
+
+    @override
+    async def aget_book_by_title(self, book_title: str) -> interfaces.BookInfo:
+        try:
+            book = await Book.objects.aget(title=book_title)
+        except Book.DoesNotExist:
+            logger.info(f'book not found with title: {book_title}')
+            raise interfaces.BookNotFound(f'book not found with title: {book_title}')
+        result = self._convert_book_to_book_info(book)
+        logger.info(f'result: {result}')
+        return result
+
+    @override
+    async def aget_borrowed_book_by_id(self, id: int) -> interfaces.BorrowBookOutput:
+        try:
+            borrowed_book = await BorrowedBook.objects.aget(id=id)
+        except BorrowedBook.DoesNotExist:
+            logger.info(f'borrowed book not found with id: {id}')
+            raise interfaces.BorrowedBookNotFound(f"borrowed book not found with id: {id}'")
+        result = self._convert_borrowed_book_to_dataclass(borrowed_book)
+        logger.info(f'result: {result}')
+        return result
+
+    @override
+    async def atitles_borrowed_by(self, user_claim: account_interfaces.UserClaim, titles: List[str]) -> Set[str]:
+        result = {
+            title async for title in BorrowedBook.objects.filter(
+                username=user_claim.username,
+                book_title__in=titles,
+                return_at__isnull=True
+            ).values_list('book_title', flat=True)
+        }
+        logger.info(f'result: {result}')
+        return result
+
+    @override
+    async def ahas_user_borrowed_book(self, user_claim: account_interfaces.UserClaim, book_title) -> bool:
+        return await BorrowedBook.objects.filter(
+            username=user_claim.username,
+            book_title=book_title,
+            return_at__isnull=True
+        ).aexists()
+
+    @override
+    async def aborrow_book(self, input_data: interfaces.BorrowBookInput,
+                           penalty_rate_per_day=0.5) -> interfaces.BorrowBookOutput:
+        return await self._run_in_thread(self.borrow_book, input_data, penalty_rate_per_day)
+
+    @override
+    async def areturn_book(self, input_data: interfaces.ReturnBookInput,
+                           penalty_rate_per_day=0.5) -> interfaces.ReturnBookOutput:
+        return await self._run_in_thread(self.return_book, input_data, penalty_rate_per_day)
+
+    async def _aget_keyset_page(self, queryset, sort_field: str, limit: int, cursor: Optional[str]):
+        direction, anchor_id, anchor = self._parse_cursor(queryset, sort_field, cursor)
+        if anchor_id is not None and anchor is None:
+            anchor = await queryset.model.objects.filter(id=anchor_id).values(sort_field).afirst()
+            self._check_anchor(cursor, anchor)
+        direction, rows = self._seek(queryset, sort_field, direction, anchor_id, anchor)
+        return self._to_keyset_page(
+            queryset, sort_field, [row async for row in rows[:limit + 1]], limit, direction, anchor
+        )
+
+    @staticmethod
+    async def _run_in_thread(func, *args):
+        def run():
+            # pool threads are not tied to a request, connections are recycled here per CONN_MAX_AGE
+            close_old_connections()
+            try:
+                return func(*args)
+            finally:
+                close_old_connections()
+
+        return await sync_to_async(run, thread_sensitive=False)()
@@ -0,0 +1,224 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from utils.date_time.services import DateTimeUtils
+from . import interfaces
+from .models import Book, BorrowedBook
+from .services import AsyncLibraryFacade, LibraryFacade
+
+logger = logging.getLogger(__name__)
+
+
+# sqlite locks the whole database for a write, concurrent borrows fail on it instead of waiting for their row
+concurrent_writers_required = skipUnless(
+    connection.vendor in ('mysql', 'postgresql'), 'the database does not support concurrent writers'
+)
+
+
+class BorrowBookTransactionTestCase(TransactionTestCase):
+    threads_count = 20
+
+    def setUp(self):
+        self.service = LibraryFacade(date_time_utils=DateTimeUtils())
+
+    def _borrow(self, username: str, book_title: str) -> bool:
+        try:
+            self.service.borrow_book(interfaces.BorrowBookInput(username=username, book_title=book_title))
+            return True
+        except interfaces.BookNotAvailableException:
+            return False
+        finally:
+            connection.close()
+
+    def _borrow_concurrently(self, book_title: str, borrows_count: int, borrow=None):
+        borrow = borrow or self._borrow
+        with ThreadPoolExecutor(max_workers=self.threads_count) as executor:
+            return list(executor.map(
+                lambda i: borrow(username=f'user {i}', book_title=book_title), range(borrows_count)
+            ))
+
+
+class BorrowBookConcurrencyTestCase(BorrowBookTransactionTestCase):
+    def test_guarded_update_does_not_take_quantity_below_zero(self):
+        Book.objects.create(title='last copy', writer='writer', quantity=1)
+
+        results = [self._borrow(username=f'user {i}', book_title='last copy') for i in range(3)]
+
+        self.assertEqual(results, [True, False, False])
+        self.assertEqual(Book.objects.get(title='last copy').quantity, 0)
+        self.assertEqual(BorrowedBook.objects.filter(book_title='last copy').count(), 1)
+
+    @concurrent_writers_required
+    def test_last_copy_is_not_oversold(self):
+        Book.objects.create(title='last copy', writer='writer', quantity=1)
+
+        results = self._borrow_concurrently(book_title='last copy', borrows_count=self.threads_count * 5)
+
+        self.assertEqual(sum(results), 1)
+        self.assertEqual(Book.objects.get(title='last copy').quantity, 0)
+        self.assertEqual(BorrowedBook.objects.filter(book_title='last copy').count(), 1)
+
+    @concurrent_writers_required
+    def test_concurrent_borrows_take_every_copy_once(self):
+        copies = self.threads_count * 10
+        Book.objects.create(title='popular', writer='writer', quantity=copies)
+
+        results = self._borrow_concurrently(book_title='popular', borrows_count=copies + self.threads_count)
+
+        self.assertEqual(sum(results), copies)
+        self.assertEqual(Book.objects.get(title='popular').quantity, 0)
+        borrowers = BorrowedBook.objects.filter(book_title='popular').values_list('username', flat=True)
+        self.assertEqual(sorted(borrowers), sorted(f'user {i}' for i, result in enumerate(results) if result))
+
+    def test_return_book_restores_quantity(self):
+        Book.objects.create(title='returned', writer='writer', quantity=1)
+        self._borrow(username='reader', book_title='returned')
+
+        self.service.return_book(interfaces.ReturnBookInput(username='reader', borrowed_book_title='returned'))
+
+        self.assertEqual(Book.objects.get(title='returned').quantity, 1)
+        self.assertIsNotNone(BorrowedBook.objects.get(book_title='returned').return_at)
+
+
+@skipUnless(os.getenv('RUN_BENCHMARKS'), 'a manual benchmark, set RUN_BENCHMARKS to run it')
+@concurrent_writers_required
+class BorrowThroughputBenchmarkTestCase(BorrowBookTransactionTestCase):
+    copies = 500
+
+    def _borrow_with_row_lock(self, username: str, book_title: str) -> bool:
+        """
+            the read, check and save the conditional update replaced, with the row lock it needs to not oversell
+        """
+        try:
+            with transaction.atomic():
+                book = Book.objects.select_for_update().get(title=book_title)
+                if book.quantity <= 0:
+                    return False
+                book.quantity -= 1
+                book.save()
+                BorrowedBook.objects.create(book=book, username=username, book_title=book_title)
+                return True
+        finally:
+            connection.close()
+
+    def _measure(self, book_title: str, borrow) -> float:
+        Book.objects.create(title=book_title, writer='writer', quantity=self.copies)
+        started = time.perf_counter()
+        results = self._borrow_concurrently(book_title=book_title, borrows_count=self.copies, borrow=borrow)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(sum(results), self.copies)
+        return self.copies / elapsed
+
+    def test_conditional_update_throughput(self):
+        locked_throughput = self._measure('locked', self._borrow_with_row_lock)
+        conditional_throughput = self._measure('conditional', self._borrow)
+
+        logger.info(f'row lock: {locked_throughput:.1f} borrows/s, '
+                    f'conditional update: {conditional_throughput:.1f} borrows/s')
+        self.assertGreaterEqual(conditional_throughput, locked_throughput)
+
+
+class AsyncLibraryFacadeTestCase(TransactionTestCase):
+    def setUp(self):
+        self.service = AsyncLibraryFacade(date_time_utils=DateTimeUtils())
+
+    @concurrent_writers_required
+    async def test_concurrent_async_borrows_do_not_oversell(self):
+        await Book.objects.acreate(title='async copy', writer='writer', quantity=3)
+
+        results = await asyncio.gather(*[
+            self.service.aborrow_book(interfaces.BorrowBookInput(username=f'user {i}', book_title='async copy'))
+            for i in range(10)
+        ], return_exceptions=True)
+
+        self.assertEqual(len([result for result in results if isinstance(result, interfaces.BorrowBookOutput)]), 3)
+        self.assertEqual((await Book.objects.aget(title='async copy')).quantity, 0)
+
+    async def test_pages_by_cursor(self):
+        await Book.objects.abulk_create([Book(title=f'title {i}', writer='writer', quantity=1) for i in range(5)])
+
+        first = await self.service.aget_books_by_cursor(interfaces.BookFilter(), limit=3)
+        second = await self.service.aget_books_by_cursor(interfaces.BookFilter(), limit=3, cursor=first.next_cursor)
+
+        self.assertEqual([book.title for book in first.results], ['title 0', 'title 1', 'title 2'])
+        self.assertEqual([book.title for book in second.results], ['title 3', 'title 4'])
+        self.assertIsNone(second.next_cursor)
+
+    async def test_pages_by_cursor_through_null_sort_keys(self):
+        await BorrowedBook.objects.abulk_create([
+            BorrowedBook(username='reader', book_title=f'title {i}', borrowed_at=borrowed_at, due_at=0)
+            for i, borrowed_at in enumerate([None, 200, None, 100, None])
+        ])
+
+        pages = [await self.service.aget_borrowed_books_by_cursor(interfaces.BorrowedBookFilter(), limit=2)]
+        while pages[-1].next_cursor:
+            pages.append(await self.service.aget_borrowed_books_by_cursor(
+                interfaces.BorrowedBookFilter(), limit=2, cursor=pages[-1].next_cursor
+            ))
+        previous = await self.service.aget_borrowed_books_by_cursor(
+            interfaces.BorrowedBookFilter(), limit=2, cursor=pages[-1].previous_cursor
+        )
+
+        self.assertEqual(
+            [[book.book_title for book in page.results] for page in pages],
+            [['title 0', 'title 2'], ['title 4', 'title 3'], ['title 1']],
+        )
+        self.assertEqual([book.book_title for book in previous.results], ['title 4', 'title 3'])
+
+    async def test_cursor_of_a_deleted_row(self):
+        await BorrowedBook.objects.abulk_create([
+            BorrowedBook(username='reader', book_title=f'title {i}', borrowed_at=i, due_at=0) for i in range(4)
+        ])
+        await Book.objects.abulk_create([Book(title=f'title {i}', writer='writer', quantity=1) for i in range(4)])
+        borrowed_books = await self.service.aget_borrowed_books_by_cursor(interfaces.BorrowedBookFilter(), limit=2)
+        books = await self.service.aget_books_by_cursor(interfaces.BookFilter(), limit=2)
+
+        await BorrowedBook.objects.filter(book_title='title 1').adelete()
+        await Book.objects.filter(title='title 1').adelete()
+        next_borrowed_books = await self.service.aget_borrowed_books_by_cursor(
+            interfaces.BorrowedBookFilter(), limit=2, cursor=borrowed_books.next_cursor
+        )
+
+        self.assertEqual([book.book_title for book in next_borrowed_books.results], ['title 2', 'title 3'])
+        self.assertIsNotNone(next_borrowed_books.previous_cursor)
+        with self.assertRaises(interfaces.InvalidCursor):
+            await self.service.aget_books_by_cursor(interfaces.BookFilter(), limit=2, cursor=books.next_cursor)
+
+
+class BorrowedBookReferencesTestCase(TestCase):
+    def test_backfill_matches_titles_and_usernames(self):
+        migration = importlib.import_module('apps.borrowing_book.migrations.0004_borrowedbook_book_borrowedbook_user')
+        first, _ = Book.objects.bulk_create([Book(title='title', writer='writer'), Book(title='title', writer='other')])
+        reader = get_user_model().objects.create(username='reader')
+        matched = BorrowedBook.objects.create(username='reader', book_title='title')
+        unmatched = BorrowedBook.objects.create(username='unknown', book_title='unknown')
+
+        migration.backfill_book_and_user(apps, None)
+
+        matched.refresh_from_db()
+        unmatched.refresh_from_db()
+        # of duplicated titles the first book is taken
+        self.assertEqual((matched.book_id, matched.user_id), (first.id, reader.id))
+        self.assertEqual((unmatched.book_id, unmatched.user_id), (None, None))
+
+    def test_deleting_a_book_or_user_keeps_their_loans(self):
+        book = Book.objects.create(title='title', writer='writer')
+        reader = get_user_model().objects.create(username='reader')
+        borrowed_book = BorrowedBook.objects.create(book=book, user=reader, username='reader', book_title='title')
+
+        book.delete()
+        reader.delete()
+
+        borrowed_book.refresh_from_db()
+        self.assertEqual((borrowed_book.book_id, borrowed_book.user_id), (None, None))
+        self.assertEqual((borrowed_book.username, borrowed_book.book_title), ('reader', 'title'))
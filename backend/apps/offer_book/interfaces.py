@@ -78,3 +78,6 @@ class AbstractOfferBookService(abc.ABC):
         if result.count != 1:
             raise OfferedBookNotFound(f'offered book not found with uid : {uid}')
         return result.results[0]
+
+    async def async_get_offered_book(self, *args, **kwargs) -> OfferBookInfo:
+        return await sync_to_async(self.get_offered_book)(*args, **kwargs)
@@ -33,6 +33,38 @@ class OfferBookService(interfaces.AbstractOfferBookService):
         logger.info(f'deposit_results: {deposit_results}')
         return deposit_results
 
+    async def async_get_offer_books(
+            self,
+            caller: account_interfaces.UserClaim,
+            filters: interfaces.OfferBookFilters
+    ) -> interfaces.OfferBookList:
+        logger.info(f'caller: {caller}, filters: {filters}')
+        queryset = OfferBook.objects.filter(**filters.as_dict()).order_by(filters.order_by)
+        count = await queryset.acount()
+        deposit_results = interfaces.OfferBookList(
+            count=count,
+            results=[
+                self._convert_offer_book_to_dataclass(offer_book=offer_book)
+                async for offer_book in queryset[filters.offset:filters.offset + filters.limit]
+            ]
+        )
+        logger.info(f'deposit_results: {deposit_results}')
+        return deposit_results
+
+    def get_offered_book(self, caller: account_interfaces.UserClaim, uid) -> interfaces.OfferBookInfo:
+        logger.info(f'caller: {caller}, uid: {uid}')
+        try:
+            return self._convert_offer_book_to_dataclass(OfferBook.objects.get(uid=uid))
+        except OfferBook.DoesNotExist:
+            raise interfaces.OfferedBookNotFound(f'offered book not found with uid : {uid}')
+
+    async def async_get_offered_book(self, caller: account_interfaces.UserClaim, uid) -> interfaces.OfferBookInfo:
+        logger.info(f'caller: {caller}, uid: {uid}')
+        try:
+            return self._convert_offer_book_to_dataclass(await OfferBook.objects.aget(uid=uid))
+        except OfferBook.DoesNotExist:
+            raise interfaces.OfferedBookNotFound(f'offered book not found with uid : {uid}')
+
     def add_offer_book(
             self,
             caller: account_interfaces.UserClaim,
@@ -53,6 +85,26 @@ class OfferBookService(interfaces.AbstractOfferBookService):
         logger.info(f'offered book: {offer_book_dc}')
         return offer_book_dc
 
+    async def async_add_offer_book(
+            self,
+            caller: account_interfaces.UserClaim,
+            request: interfaces.OfferBookRequest
+    ) -> interfaces.OfferBookInfo:
+        logger.info(f'caller: {caller}, request: {request}')
+        offer_book = await OfferBook.objects.acreate(
+            uid=str(uuid.uuid4()),
+            offered_book_title=request.offered_book_title,
+            topic=request.topic,
+            author=request.author,
+            publisher=request.publisher,
+            proposer=request.proposer,
+            purchase_link=request.purchase_link,
+            offered_at=self.date_time_service.get_current_timestamp()
+        )
+        offer_book_dc = self._convert_offer_book_to_dataclass(offer_book)
+        logger.info(f'offered book: {offer_book_dc}')
+        return offer_book_dc
+
     def declare_purchase_book(self, caller: account_interfaces.UserClaim, offered_book_title, quantity):
         logger.info(f'caller: {caller}, offer_book_title: {offered_book_title}, quantity: {quantity}')
         raise NotImplementedError  # TODO: compelete this function and add it to bot
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedDispatcher:
+    """
+        hashes every update's chat id into one of workers_count queues, each consumed by a single worker.
+        updates of different chats run in parallel while updates of one chat are handled strictly in order.
+        the order only holds within one process, updates posted to several worker processes are not ordered.
+    """
+
+    def __init__(
+            self,
+            callback: Callable[..., Awaitable],
+            workers_count: int = 8,
+            queue_size: int = 100,
+    ):
+        if workers_count < 1:
+            raise ValueError('workers_count should be greater than 0')
+        self.callback = callback
+        self.workers_count = workers_count
+        self.queue_size = queue_size
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+
+    @staticmethod
+    def get_chat_id(update) -> Optional[int]:
+        chat = update.effective_chat
+        return chat.id if chat else None
+
+    def get_queue_index(self, chat_id: Optional[int]) -> int:
+        return int(chat_id or 0) % self.workers_count
+
+    def _start(self):
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers_count)]
+        self._workers = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+        logger.info(f'dispatcher started with {self.workers_count} workers, queue size: {self.queue_size}')
+
+    async def dispatch(self, update, context):
+        if not self._workers:
+            self._start()
+        chat_id = self.get_chat_id(update)
+        # waits while the chat's queue is full, which back-pressures the update source
+        await self._queues[self.get_queue_index(chat_id)].put((update, context))
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            update, context = await queue.get()
+            try:
+                await self.callback(update, context)
+            except Exception as e:
+                logger.error(f'error while handling update: {e}')
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        await asyncio.gather(*[queue.join() for queue in self._queues])
+
+    async def stop(self):
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queues = []
+        self._workers = []
@@ -1,5 +1,6 @@
 import abc
 from enum import Enum
+from typing import Dict
 
 from apps.account import interfaces as accounts_interfaces
 from lib import data_classes as lib_dataclasses
@@ -20,6 +21,19 @@ class SendMessageRequest(lib_dataclasses.BaseModel):
     message: str
 
 
+class ProcessNotFound(Exception):
+    pass
+
+
+class ProcessState(lib_dataclasses.BaseModel):
+    uid: str
+    id: int | None = None
+    type: str
+    status: str | None = None
+    step_counter: int = 0
+    fields: Dict[str, str] = {}
+
+
 
 class AbstractBotPlatform(abc.ABC):
     @abc.abstractmethod
@@ -42,3 +56,36 @@ class AbstractBotPlatform(abc.ABC):
                 message_request (SendMessageRequest): request containing contact uid and message
         """
         raise NotImplemented
+
+
+class AbstractProcessStore(abc.ABC):
+    """
+        keeps the state of in-flight bot processes (multi-step flows) between the user's messages
+    """
+
+    @abc.abstractmethod
+    async def create(self, uid: str, process_type: str, status: str) -> ProcessState:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, uid: str) -> ProcessState:
+        """
+        Raise:
+            ProcessNotFound
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def add_field(self, process: ProcessState, name: str, value: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def save(self, process: ProcessState):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def finish(self, process: ProcessState):
+        """
+            called once the last step is done, the process and its fields must be persisted afterward
+        """
+        raise NotImplementedError
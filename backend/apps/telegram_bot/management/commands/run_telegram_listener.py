@@ -6,8 +6,8 @@ logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'listens to telegram in blocking mode'
+    help = 'listens to telegram in blocking mode, or registers the webhook when TELEGRAM_UPDATE_MODE is webhook'
 
     def handle(self, *args, **kwargs):
         service = get_bootstrapper().get_telegram_bot()
-        service.start_polling()
+        service.run()
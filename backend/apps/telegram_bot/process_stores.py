@@ -0,0 +1,108 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from utils.cache import interfaces as cache_interfaces
+from . import interfaces
+from .models import Process, Field
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseProcessStore(interfaces.AbstractProcessStore):
+    """
+        writes every step of the process to Process and Field rows
+    """
+
+    async def create(self, uid: str, process_type: str, status: str) -> interfaces.ProcessState:
+        process = await Process.objects.acreate(uid=uid, type=process_type, status=status)
+        logger.info(f'process: {process}')
+        return self._convert_process_to_dataclass(process)
+
+    async def get(self, uid: str) -> interfaces.ProcessState:
+        try:
+            process = await Process.objects.aget(uid=uid)
+        except Process.DoesNotExist:
+            raise interfaces.ProcessNotFound(f'process not found with uid: {uid}')
+        return self._convert_process_to_dataclass(process)
+
+    async def add_field(self, process: interfaces.ProcessState, name: str, value: str):
+        process.fields[name] = value
+        field = await Field.objects.acreate(
+            process_id=process.id,
+            name=name,
+            value=value
+        )
+        logger.info(f'field: {field}')
+
+    async def save(self, process: interfaces.ProcessState):
+        await Process.objects.filter(uid=process.uid).aupdate(
+            status=process.status,
+            step_counter=process.step_counter
+        )
+
+    async def finish(self, process: interfaces.ProcessState):
+        await self.save(process)
+
+    @staticmethod
+    def _convert_process_to_dataclass(process: Process) -> interfaces.ProcessState:
+        return interfaces.ProcessState(
+            uid=process.uid,
+            id=process.id,
+            type=process.type,
+            status=process.status,
+            step_counter=process.step_counter,
+        )
+
+
+class CacheProcessStore(interfaces.AbstractProcessStore):
+    """
+        keeps in-flight processes only in the cache, Process and Field rows are written once the process finishes.
+        a process left idle longer than timeout (seconds) is lost.
+    """
+
+    def __init__(self, cache: cache_interfaces.AbstractCache, timeout: int):
+        self.cache = cache
+        self.timeout = timeout
+
+    @staticmethod
+    def _get_cache_key(uid: str) -> str:
+        return f'process_state_{uid}'
+
+    async def create(self, uid: str, process_type: str, status: str) -> interfaces.ProcessState:
+        process = interfaces.ProcessState(uid=uid, type=process_type, status=status)
+        await self.save(process)
+        return process
+
+    async def get(self, uid: str) -> interfaces.ProcessState:
+        process = await self.cache.aget(self._get_cache_key(uid))
+        if process is None:
+            raise interfaces.ProcessNotFound(f'process not found with uid: {uid}')
+        return interfaces.ProcessState(**process)
+
+    async def add_field(self, process: interfaces.ProcessState, name: str, value: str):
+        process.fields[name] = value
+
+    async def save(self, process: interfaces.ProcessState):
+        await self.cache.aset(self._get_cache_key(process.uid), process.model_dump(), timeout=self.timeout)
+
+    async def finish(self, process: interfaces.ProcessState):
+        db_process = await sync_to_async(self._write_process)(process)
+        # only once the rows are committed, a failed write leaves the process in the cache to be finished again
+        await self.cache.adelete(self._get_cache_key(process.uid))
+        logger.info(f'process: {db_process}')
+
+    @staticmethod
+    def _write_process(process: interfaces.ProcessState) -> Process:
+        with transaction.atomic():
+            # the rows of an earlier finish whose cache delete failed are kept as they are
+            db_process, created = Process.objects.get_or_create(
+                uid=process.uid,
+                defaults=dict(type=process.type, status=process.status, step_counter=process.step_counter),
+            )
+            if created:
+                Field.objects.bulk_create([
+                    Field(process=db_process, name=name, value=value) for name, value in process.fields.items()
+                ])
+        return db_process
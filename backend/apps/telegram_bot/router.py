@@ -0,0 +1,113 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouteRequest:
+    update: Any
+    context: Any
+    chat_id: int
+    text: str
+    route_key: str = ''
+    argument: Optional[str] = None
+    user_claim: Any = None
+    contact: Any = None
+
+
+Middleware = Callable[[RouteRequest, Callable[[RouteRequest], Awaitable]], Awaitable]
+
+
+class UpdateRouter:
+    """
+        dispatches updates through a dict of route keys instead of trying every prefix in turn.
+        the route key of a command is the command itself (`/books`), the one of callback data is the part before
+        its first `_` (`show-bb` of `show-bb_12`) and the rest is passed to the handler as its argument.
+        handlers are called as handler(update, context, user_claim[, argument]).
+    """
+
+    def __init__(self, default_handler: Callable[..., Awaitable], middlewares: List[Middleware] = None):
+        self.middlewares = list(middlewares or [])
+        self._routes: Dict[str, Callable[[RouteRequest], Awaitable]] = {}
+        self._default_route = self._chain(self._get_endpoint(default_handler, None), [])
+
+    @staticmethod
+    def parse(text: str) -> Tuple[str, Optional[str]]:
+        if text.startswith('/'):
+            # `/books@library_bot extra` -> `/books`
+            return text.split()[0].split('@')[0], None
+        route_key, _, argument = text.partition('_')
+        return route_key, argument or None
+
+    def add_route(
+            self,
+            route_key: str,
+            handler: Callable[..., Awaitable],
+            argument_type: Optional[Callable[[str], Any]] = str,
+            middlewares: List[Middleware] = None,
+    ):
+        if route_key in self._routes:
+            raise ValueError(f'route {route_key} is already registered')
+        self._routes[route_key] = self._chain(self._get_endpoint(handler, argument_type), middlewares or [])
+
+    async def route(self, request: RouteRequest):
+        request.route_key, request.argument = self.parse(request.text or '')
+        await self._routes.get(request.route_key, self._default_route)(request)
+
+    @staticmethod
+    def _get_endpoint(handler: Callable[..., Awaitable], argument_type: Optional[Callable[[str], Any]]):
+        async def endpoint(request: RouteRequest):
+            if request.argument is None or argument_type is None:
+                return await handler(request.update, request.context, request.user_claim)
+            return await handler(request.update, request.context, request.user_claim, argument_type(request.argument))
+
+        return endpoint
+
+    def _chain(self, endpoint: Callable[[RouteRequest], Awaitable], route_middlewares: List[Middleware]):
+        # composed once per route, so dispatching an update does not depend on the number of routes
+        chained = endpoint
+        for middleware in reversed(self.middlewares + route_middlewares):
+            chained = self._wrap(middleware, chained)
+        return chained
+
+    @staticmethod
+    def _wrap(middleware: Middleware, call_next: Callable[[RouteRequest], Awaitable]):
+        async def wrapped(request: RouteRequest):
+            return await middleware(request, call_next)
+
+        return wrapped
+
+
+async def timing_middleware(request: RouteRequest, call_next):
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        logger.info(f'route: {request.route_key}, chat_id: {request.chat_id}, '
+                    f'took: {(time.perf_counter() - started) * 1000:.1f} ms')
+
+
+def get_error_middleware(
+        error_messages: Dict[type, str],
+        default_message: str,
+        send_message: Callable[..., Awaitable],
+) -> Middleware:
+    """
+        answers the chat with the message mapped to the raised exception type instead of failing silently
+    """
+
+    async def error_middleware(request: RouteRequest, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            logger.error(f'error in route: {request.route_key}, chat_id: {request.chat_id}: {e}')
+            message = next(
+                (message for error_type, message in error_messages.items() if isinstance(e, error_type)),
+                default_message
+            )
+            await send_message(request.context.bot, chat_id=request.chat_id, text=message)
+
+    return error_middleware
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+            takes a token, possibly in advance, and returns the seconds to wait before it may be used
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimitedSender:
+    """
+        sends every outbound bot call through a global and a per-chat token bucket (telegram allows about 30
+        messages per second overall and one per second per chat) and waits and retries on flood control errors.
+        the messages of a chat take their turns in the order they are sent.
+        the buckets are per process, with several worker processes global_rate should be shared between them.
+    """
+
+    def __init__(
+            self,
+            global_rate: float = 30,
+            chat_rate: float = 1,
+            chat_burst: float = 3,
+            max_retries: int = 3,
+            max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets = OrderedDict()
+        self._paused_until = 0.0
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst)
+            while len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id=None):
+        if chat_id is not None:
+            await self._get_chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def _call(self, method, rate_chat_id=None, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(rate_chat_id)
+            try:
+                return await method(**kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f'flood control on {method.__name__}, retry after {retry_after}s, attempt: {attempt}')
+                if attempt == self.max_retries:
+                    raise e
+                # every other call waits too, telegram applies the limit to the whole bot
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    async def send_message(self, bot, chat_id, text, **kwargs):
+        return await self._call(bot.send_message, rate_chat_id=chat_id, chat_id=chat_id, text=text, **kwargs)
+
+    async def send_photo(self, bot, chat_id, photo, **kwargs):
+        return await self._call(bot.send_photo, rate_chat_id=chat_id, chat_id=chat_id, photo=photo, **kwargs)
+
+    async def edit_message_text(self, bot, chat_id, message_id, text, **kwargs):
+        return await self._call(
+            bot.edit_message_text, rate_chat_id=chat_id, chat_id=chat_id, message_id=message_id, text=text, **kwargs
+        )
+
+    async def delete_message(self, bot, chat_id, message_id):
+        # deleting and answering callbacks send nothing to the chat, only the global limit applies
+        return await self._call(bot.delete_message, chat_id=chat_id, message_id=message_id)
+
+    async def answer_callback_query(self, bot, callback_query_id, **kwargs):
+        return await self._call(bot.answer_callback_query, callback_query_id=callback_query_id, **kwargs)
@@ -1,21 +1,28 @@
+import asyncio
+import hmac
 import logging
 import uuid
 from datetime import timedelta
-from typing import Optional
+from typing import Dict, Optional
 from math import ceil
 
 from asgiref.sync import sync_to_async
-from django.core.cache import cache
 from django.db import transaction
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import CallbackContext, Updater, CallbackQueryHandler, CommandHandler, MessageHandler
 
 from apps.account import interfaces as account_interfaces
 from apps.borrowing_book import interfaces as borrowing_book_interfaces
 from apps.offer_book import interfaces as offer_book_interfaces
 
+from apps.telegram_bot import interfaces as telegram_bot_app_interfaces
+from apps.telegram_bot.dispatcher import ChatOrderedDispatcher
 from apps.telegram_bot.models import Contact, Process, Field
+from apps.telegram_bot.router import RouteRequest, UpdateRouter, get_error_middleware, timing_middleware
+from apps.telegram_bot.sender import RateLimitedSender
 from externals.telegram_bot import interfaces as telegram_bot_interfaces
+from utils.cache import interfaces as cache_interfaces
 from utils.date_time import interfaces as date_time_interfaces
 
 logger = logging.getLogger(__name__)
@@ -30,6 +37,11 @@ PURCHASE_LINK = 'purchase_link'
 REGISTRATION = "registration"
 USERNAME = 'username'
 
+DISMISS_COMMAND = "/dismiss"
+
+UPDATE_MODE_POLLING = 'polling'
+UPDATE_MODE_WEBHOOK = 'webhook'
+
 
 class TelegramBotService:
 
@@ -39,10 +51,20 @@ class TelegramBotService:
             telegram_api_address: str,
             telegram_proxy: Optional[str],
             account_service: account_interfaces.AbstractAccountService,
-            borrowing_book: borrowing_book_interfaces.AbstractLibraryFacade,
+            borrowing_book: borrowing_book_interfaces.AbstractAsyncLibraryFacade,
             offer_book: offer_book_interfaces.AbstractOfferBookService,
             date_time_utils: date_time_interfaces.AbstractDateTimeUtils,
-            token: str
+            contact_cache: cache_interfaces.AbstractCache,
+            process_store: telegram_bot_app_interfaces.AbstractProcessStore,
+            sender: RateLimitedSender,
+            token: str,
+            update_mode: str = UPDATE_MODE_POLLING,
+            webhook_url: Optional[str] = None,
+            webhook_secret: Optional[str] = None,
+            webhook_max_connections: int = 1,
+            dispatcher_workers: int = 0,
+            dispatcher_queue_size: int = 100,
+            contact_cache_timeout: Optional[int] = None,
     ):
         self.telegram_application_factory = telegram_application_factory
         self.telegram_api_address = telegram_api_address
@@ -51,8 +73,26 @@ class TelegramBotService:
         self.borrowing_book_service = borrowing_book
         self.offer_book_service = offer_book
         self.date_time_utils = date_time_utils
+        self.contact_cache = contact_cache
+        self.contact_cache_timeout = contact_cache_timeout
+        self.process_store = process_store
+        self.sender = sender
+        self._edited_callback_queries = set()
         self.cache_timeout = timedelta(days=1)
         self.token = token
+        self.update_mode = update_mode
+        if update_mode == UPDATE_MODE_WEBHOOK and not webhook_secret:
+            raise ValueError('webhook_secret is required in webhook update mode')
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.webhook_max_connections = webhook_max_connections
+        self._webhook_application = None
+        self._webhook_application_lock = None
+        self.dispatcher = ChatOrderedDispatcher(
+            callback=self.handler,
+            workers_count=dispatcher_workers,
+            queue_size=dispatcher_queue_size,
+        ) if dispatcher_workers > 0 else None
 
         self._command_text = (" Here are some commands you can use:\n"
                               "/books - View List of all books\n"
@@ -84,20 +124,86 @@ class TelegramBotService:
             },
 
         }
+        self.router = self._build_router()
 
-    def start_polling(self):
+    def _build_application(self) -> telegram_bot_interfaces.AbstractTelegramApplication:
         bot = self.telegram_application_factory.get_telegram_application(
             token=self.token,
             base_api_address=self.telegram_api_address
         )
 
-        bot.add_handler(CallbackQueryHandler(self.handler))
-        bot.add_handler(MessageHandler(None, self.handler))
-        bot.add_handler(CommandHandler(["start", "books", "borrowed_books"], self.handler))
+        callback = self.dispatcher.dispatch if self._uses_dispatcher() else self.handler
+        bot.add_handler(CallbackQueryHandler(callback))
+        bot.add_handler(MessageHandler(None, callback))
+        bot.add_handler(CommandHandler(["start", "books", "borrowed_books"], callback))
+        return bot
+
+    def _uses_dispatcher(self) -> bool:
+        """
+            the dispatcher keeps the updates of a chat in order only within its process. webhook updates are
+            spread over every worker process, so with one webhook connection they are handled before the webhook
+            responds, and telegram does not post the next update until then.
+        """
+        if self.dispatcher is None:
+            return False
+        return self.update_mode != UPDATE_MODE_WEBHOOK or self.webhook_max_connections > 1
+
+    def run(self):
+        if self.update_mode == UPDATE_MODE_WEBHOOK:
+            self.set_webhook()
+        else:
+            self.start_polling()
 
+    def start_polling(self):
+        bot = self._build_application()
         bot.run_polling()
         logger.info("Bot started polling.")
 
+    def set_webhook(self):
+        """
+            registers webhook_url on telegram, updates will then be posted to the webhook view of every
+            process serving runner.asgi instead of being polled by a single listener.
+            webhook_max_connections above 1 lets telegram post updates in parallel, then the updates of a chat are
+            only kept in order within each process, as the rate limits of the sender are.
+        """
+        if not self.webhook_url:
+            raise ValueError('webhook_url is required in webhook update mode')
+
+        async def _set_webhook():
+            bot = self._build_application()
+            async with bot:
+                await bot.bot.set_webhook(
+                    url=self.webhook_url,
+                    secret_token=self.webhook_secret,
+                    max_connections=self.webhook_max_connections,
+                )
+
+        asyncio.run(_set_webhook())
+        logger.info(f"Bot webhook set on {self.webhook_url}.")
+
+    def is_valid_webhook_secret(self, secret_token: Optional[str]) -> bool:
+        # the secret is the only proof that an update comes from telegram, without it every update is refused
+        if not self.webhook_secret or not secret_token:
+            return False
+        return hmac.compare_digest(self.webhook_secret, secret_token)
+
+    async def _get_webhook_application(self) -> telegram_bot_interfaces.AbstractTelegramApplication:
+        if self._webhook_application is None:
+            if self._webhook_application_lock is None:
+                self._webhook_application_lock = asyncio.Lock()
+            async with self._webhook_application_lock:
+                if self._webhook_application is None:
+                    application = self._build_application()
+                    await application.initialize()
+                    self._webhook_application = application
+                    logger.info("Bot webhook application initialized.")
+        return self._webhook_application
+
+    async def process_webhook_update(self, data: dict):
+        application = await self._get_webhook_application()
+        update = Update.de_json(data, application.bot)
+        await application.process_update(update)
+
     async def process_engine(
             self,
             update: Update,
@@ -105,34 +211,131 @@ class TelegramBotService:
             user_claim: account_interfaces.UserClaim,
             process_uid: str
     ):
-        process = await Process.objects.aget(uid=process_uid)
+        try:
+            process = await self.process_store.get(process_uid)
+        except telegram_bot_app_interfaces.ProcessNotFound:
+            logger.info(f'process expired: {process_uid}')
+            contact = await self._get_contact(user_claim.telegram_id)
+            contact.process_uid = None
+            await self._save_contact(contact)
+            await self.sender.send_message(
+                context.bot,
+                chat_id=user_claim.telegram_id,
+                text=f"Your process has expired, please start it again.\n\n{self._command_text}"
+            )
+            return
         logger.info(f'user_claim: {user_claim}, process: {process}')
         if process.status != Process.STATUS_INITIATE:
-            field = await Field.objects.acreate(
-                process=process,
-                name=process.status,
-                value=update.message.text
-            )
-            logger.info(f'field: {field}')
+            await self.process_store.add_field(process, name=process.status, value=update.message.text)
 
         process.step_counter += 1
         process.status = self.process_instruction[process.type][process.step_counter]
         if process.status == Process.STATUS_FINISHED:
             # final step of process
+            await self.process_store.finish(process)
             await self.process_final_step_mapper.get(process.type)(update, context, user_claim, process.uid)
             return
         message = self.process_message_handler[process.type][process.status]
         logger.info(f'status: {process.status}, message: {message}')
-        await process.asave()
-        await context.bot.send_message(chat_id=user_claim.telegram_id, text=message)
+        await self.process_store.save(process)
+        await self.sender.send_message(context.bot, chat_id=user_claim.telegram_id, text=message)
 
     @staticmethod
-    def _get_cached_user_claim(telegram_id: int) -> Optional[account_interfaces.UserClaim]:
-        return cache.get(f"user_claim_{telegram_id}")
+    async def _get_process_fields(process_uid: str) -> Dict[str, str]:
+        """
+            loads every field of a finished process in a single query, as a field name to value map.
+            final steps of process_instruction flows read their collected inputs through it.
+        """
+        return {
+            name: value
+            async for name, value in Field.objects.filter(process__uid=process_uid).values_list('name', 'value')
+        }
 
-    async def _cache_user_claim(self, telegram_id: int, user_claim: account_interfaces.UserClaim):
-        logger.info(f'cache: {telegram_id}: {user_claim}')
-        cache.set(f"user_claim_{telegram_id}", user_claim, 24 * 60 * 60)
+    @staticmethod
+    def _get_contact_cache_key(chat_id) -> str:
+        return f'telegram_contact:{chat_id}'
+
+    async def _get_contact(self, chat_id) -> Contact:
+        cache_key = self._get_contact_cache_key(chat_id)
+        contact = await self.contact_cache.aget(cache_key)
+        if contact is None:
+            contact = await Contact.objects.aget(chat_id=chat_id)
+            await self.contact_cache.aset(cache_key, contact, timeout=self.contact_cache_timeout)
+        return contact
+
+    async def _save_contact(self, contact: Contact):
+        cache_key = self._get_contact_cache_key(contact.chat_id)
+        try:
+            await contact.asave()
+        except Exception:
+            # the cached instance may now differ from the stored row
+            await self.contact_cache.adelete(cache_key)
+            raise
+        await self.contact_cache.aset(cache_key, contact, timeout=self.contact_cache_timeout)
+
+    def _build_router(self) -> UpdateRouter:
+        router = UpdateRouter(
+            default_handler=self.handle_unknown,
+            middlewares=[
+                timing_middleware,
+                get_error_middleware(
+                    error_messages={
+                        ValueError: "Invalid request, please try again.",
+                        borrowing_book_interfaces.BookNotFound: "The book was not found.",
+                        offer_book_interfaces.OfferedBookNotFound: "The offered book was not found.",
+                    },
+                    default_message="An error occurred. Please try again.",
+                    send_message=self.sender.send_message,
+                ),
+                self._authentication_middleware,
+                self._process_middleware,
+            ]
+        )
+        router.add_route(DISMISS_COMMAND, self.handle_dismiss, argument_type=None)
+        router.add_route("/start", self.show_welcome_message, argument_type=None)
+        router.add_route("/books", self.show_book_list, argument_type=None)
+        router.add_route("page", self.show_book_list)
+        router.add_route("/borrowed_books", self.show_borrowed_book_list, argument_type=None)
+        router.add_route("bb-page", self.show_borrowed_book_list)
+        router.add_route("/offered_books", self.show_offered_books_list, argument_type=None)
+        router.add_route("ofb-page", self.show_offered_books_list, argument_type=int)
+        router.add_route("/offer_book", self.offer_book_process, argument_type=None)
+        router.add_route("show-bb", self.show_borrowed_book_details, argument_type=int)
+        router.add_route("show-ofb", self.show_offered_book_details)
+        router.add_route("show", self.show_book_details)
+        router.add_route("borrow", self.borrow_book)
+        router.add_route("return", self.return_book)
+        return router
+
+    async def _authentication_middleware(self, request: RouteRequest, call_next):
+        chat_id = request.chat_id
+        try:
+            # cached by the account service
+            user_claim = await self.account_service.telegram_authentication(telegram_id=chat_id)
+        except account_interfaces.UserNotFound:
+            logger.info(f'user not found with chat id {chat_id}')
+            if await Contact.objects.filter(chat_id=chat_id, status=Contact.STATUS_WAITING_FOR_USERNAME).aexists():
+                logger.debug('contact exists and status waiting for username')
+                await self.registration_username(request.update, request.context)
+                return
+            await self.show_registration_prompt(request.update, request.context)
+            return
+        except Exception as e:
+            logger.error(f"Error during authentication: {str(e)}")
+            await self.sender.send_message(
+                request.context.bot, chat_id=chat_id, text="An error occurred. Please try again.")
+            return
+        request.user_claim = user_claim
+        await call_next(request)
+
+    async def _process_middleware(self, request: RouteRequest, call_next):
+        # while a process is in flight every input but /dismiss belongs to it
+        request.contact = await self._get_contact(request.user_claim.telegram_id)
+        if request.contact.process_uid and request.route_key != DISMISS_COMMAND:
+            logger.info(f'process: {request.contact.process_uid}')
+            await self.process_engine(request.update, request.context, request.user_claim, request.contact.process_uid)
+            return
+        await call_next(request)
 
     async def handler(self, update: Update, context: CallbackContext):
         chat_id = update.message.chat_id if update.message else update.callback_query.message.chat_id
@@ -140,77 +343,47 @@ class TelegramBotService:
 
         logger.info(f" \n\n\n >>>>>>>> Received input from chat_id: {chat_id}, text/data: {text} <<<<<<<<< \n\n\n")
 
-        user_claim = self._get_cached_user_claim(chat_id)
-
-        if not user_claim:
-            logger.debug('not cached user_claim')
-            try:
-                user_claim = await self.account_service.telegram_authentication(telegram_id=chat_id)
-                await self._cache_user_claim(chat_id, user_claim)
-            except account_interfaces.UserNotFound:
-                logger.info(f'user not found with chat id {chat_id}')
-                if await Contact.objects.filter(chat_id=chat_id, status=Contact.STATUS_WAITING_FOR_USERNAME).aexists():
-                    logger.debug('contact exists and status waiting for username')
-                    await self.registration_username(update, context)
-                    return
-                await self.show_registration_prompt(update, context)
-                return
-            except Exception as e:
-                logger.error(f"Error during authentication: {str(e)}")
-                await context.bot.send_message(chat_id=chat_id, text="An error occurred. Please try again.")
-                return
-        contact = await Contact.objects.aget(chat_id=user_claim.telegram_id)
-        if text.startswith("/dismiss"):
-            await self.handle_dismiss(update, context, user_claim, contact)
-        elif contact.process_uid:
-            logger.info(f'process: {contact.process_uid}')
-            await self.process_engine(update, context, user_claim, contact.process_uid)
-
-        elif text.startswith("/start"):
-            await self.show_welcome_message(update, context, user_claim)
-        elif text.startswith("/books") or text.startswith("page_"):
-            page = int(text.split("_")[1]) if "page_" in text else 1
-            await self.show_book_list(update, context, user_claim, page)
-        elif text.startswith("/borrowed_books") or text.startswith("bb-page_"):
-            page = int(text.split("_")[1]) if "bb-page_" in text else 1
-            await self.show_borrowed_book_list(update, context, user_claim, page)
-        elif text.startswith("/offered_books") or text.startswith("ofb-page_"):
-            page = int(text.split("_")[1]) if "ofb-page_" in text else 1
-            await self.show_offered_books_list(update, context, user_claim, page)
-        elif text.startswith("/offer_book"):
-            await self.offer_book_process(update, context, user_claim)
-        elif text.startswith("show-bb_"):
-            borrowed_book_id = text.split("_")[1]
-            await self.show_borrowed_book_details(update, context, user_claim, borrowed_book_id)
-        elif text.startswith("show-ofb_"):
-            offered_book_uid = text.split("_")[1]
-            await self.show_offered_book_details(update, context, user_claim, offered_book_uid)
-        elif text.startswith("show_"):
-            book_title = text.split("_")[1]
-            await self.show_book_details(update, context, user_claim, book_title)
-        elif text.startswith("borrow_"):
-            book_title = text.split("_")[1]
-            await self.borrow_book(update, context, user_claim, book_title)
-        elif text.startswith("return_"):
-            book_title = text.split("_")[1]
-            await self.return_book(update, context, user_claim, book_title)
-        else:
-            await self.handle_unknown(update, context)
+        await self.router.route(RouteRequest(update=update, context=context, chat_id=chat_id, text=text))
 
         if update.callback_query:
-            # Deleting the message associated with the callback query
             try:
-                await context.bot.delete_message(chat_id=chat_id, message_id=update.callback_query.message.message_id)
-                await context.bot.answer_callback_query(update.callback_query.id)
+                if update.callback_query.id in self._edited_callback_queries:
+                    self._edited_callback_queries.discard(update.callback_query.id)
+                else:
+                    # Deleting the message associated with the callback query, the answer was sent as a new one
+                    await self.sender.delete_message(
+                        context.bot, chat_id=chat_id, message_id=update.callback_query.message.message_id)
+                await self.sender.answer_callback_query(context.bot, update.callback_query.id)
             except Exception as e:
                 logger.warning(f"Failed to delete callback query message: {e}")
 
+    async def _reply(self, update: Update, context: CallbackContext, chat_id, text: str, reply_markup=None):
+        """
+            the first reply to a callback query replaces the text and keyboard of the callback's message,
+            other replies, or a failed edit, are sent as new messages.
+        """
+        callback_query = update.callback_query
+        if callback_query and callback_query.id not in self._edited_callback_queries:
+            try:
+                await self.sender.edit_message_text(
+                    context.bot,
+                    chat_id=chat_id,
+                    message_id=callback_query.message.message_id,
+                    text=text,
+                    reply_markup=reply_markup,
+                )
+                self._edited_callback_queries.add(callback_query.id)
+                return
+            except BadRequest as e:
+                logger.info(f"Failed to edit callback query message, sending it: {e}")
+        await self.sender.send_message(context.bot, chat_id=chat_id, text=text, reply_markup=reply_markup)
+
     async def show_registration_prompt(self, update: Update, context: CallbackContext):
         chat_id = update.message.chat_id
         logger.info(f'registration: {chat_id}')
         message = "Welcome for registration, please enter your username."
         await Contact.objects.acreate(chat_id=chat_id)
-        await context.bot.send_message(chat_id=chat_id, text=message)
+        await self.sender.send_message(context.bot, chat_id=chat_id, text=message)
 
     async def registration_username(self, update: Update, context: CallbackContext):
         try:
@@ -226,19 +399,19 @@ class TelegramBotService:
                 )
             )
 
-            contact = await Contact.objects.aget(chat_id=update.message.chat.id)
+            contact = await self._get_contact(update.message.chat.id)
             contact.username = username
             contact.status = Contact.STATUS_REGISTERED
-            await contact.asave()
+            await self._save_contact(contact)
             message = f'Registration complete welcome {update.message.chat.first_name}'
-            await context.bot.send_message(chat_id=update.message.chat_id, text=message)
+            await self.sender.send_message(context.bot, chat_id=update.message.chat_id, text=message)
 
         except account_interfaces.DuplicatedUserName as e:
             logger.info('duplicated username')
-            await context.bot.send_message(chat_id=update.message.chat_id, text=str(e))
+            await self.sender.send_message(context.bot, chat_id=update.message.chat_id, text=str(e))
         except Exception as e:
             logger.debug(f'exception in get username: {e}')
-            await context.bot.send_message(chat_id=update.message.chat_id, text=str(e))
+            await self.sender.send_message(context.bot, chat_id=update.message.chat_id, text=str(e))
             raise e
 
     async def show_welcome_message(self, update: Update, context: CallbackContext,
@@ -246,88 +419,92 @@ class TelegramBotService:
                                    *args):
         chat_id = update.message.chat_id
         message = f"Welcome back, {user_claim.username}! You can now browse and borrow books.\n {self._command_text}"
-        await context.bot.send_message(chat_id=chat_id, text=message)
+        await self.sender.send_message(context.bot, chat_id=chat_id, text=message)
         await self.show_book_list(update, context, user_claim)
 
     async def show_book_list(self, update: Update, context: CallbackContext, user_claim: account_interfaces.UserClaim,
-                             page: int = 1):
+                             cursor: Optional[str] = None):
         chat_id = update.message.chat_id if update.message else update.callback_query.message.chat_id
-        logger.info(f"Fetching and showing paginated book list to chat_id: {chat_id}, page: {page}")
+        logger.info(f"Fetching and showing paginated book list to chat_id: {chat_id}, cursor: {cursor}")
 
         try:
             books_per_page = 7
-            all_books = await sync_to_async(
-                self.borrowing_book_service.get_books
-            )(filters=borrowing_book_interfaces.BookFilter())
-
-            total_pages = ceil(len(all_books) / books_per_page)
+            books = await self.borrowing_book_service.aget_books_by_cursor(
+                filters=borrowing_book_interfaces.BookFilter(),
+                limit=books_per_page,
+                cursor=cursor
+            )
 
-            start_index = (page - 1) * books_per_page
-            end_index = start_index + books_per_page
-            books = all_books[start_index:end_index]
+            borrowed_titles = await self.borrowing_book_service.atitles_borrowed_by(
+                user_claim, [book.title for book in books.results]
+            )
 
             buttons = [
-                [InlineKeyboardButton(book.title, callback_data=f"show_{book.title}")]
-                for book in books
+                [
+                    InlineKeyboardButton(book.title, callback_data=f"show_{book.title}"),
+                    InlineKeyboardButton("Return", callback_data=f"return_{book.title}")
+                    if book.title in borrowed_titles
+                    else InlineKeyboardButton("Borrow", callback_data=f"borrow_{book.title}")
+                ]
+                for book in books.results
             ]
 
             navigation_buttons = []
-            if page > 1:
-                navigation_buttons.append(InlineKeyboardButton("Previous", callback_data=f"page_{page - 1}"))
-            if page < total_pages:
-                navigation_buttons.append(InlineKeyboardButton("Next", callback_data=f"page_{page + 1}"))
+            if books.previous_cursor:
+                navigation_buttons.append(
+                    InlineKeyboardButton("Previous", callback_data=f"page_{books.previous_cursor}"))
+            if books.next_cursor:
+                navigation_buttons.append(InlineKeyboardButton("Next", callback_data=f"page_{books.next_cursor}"))
 
             if navigation_buttons:
                 buttons.append(navigation_buttons)
 
             reply_markup = InlineKeyboardMarkup(buttons)
-            await context.bot.send_message(chat_id=chat_id, text="Here are the available books:",
-                                           reply_markup=reply_markup)
+            await self._reply(update, context, chat_id=chat_id, text="Here are the available books:",
+                              reply_markup=reply_markup)
         except Exception as e:
             logger.error(f"Error fetching book list: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
-                                           text=f"An error occurred while fetching the book list.: {str(e)}")
+            await self._reply(update, context, chat_id=chat_id,
+                              text=f"An error occurred while fetching the book list.: {str(e)}")
 
     async def show_borrowed_book_list(self, update: Update, context: CallbackContext,
                                       user_claim: account_interfaces.UserClaim,
-                                      page: int = 1):
+                                      cursor: Optional[str] = None):
         chat_id = update.message.chat_id if update.message else update.callback_query.message.chat_id
-        logger.info(f"Fetching and showing paginated borrowed book list to chat_id: {chat_id}, page: {page}")
+        logger.info(f"Fetching and showing paginated borrowed book list to chat_id: {chat_id}, cursor: {cursor}")
 
         try:
             books_per_page = 7
-            all_bb = await sync_to_async(
-                self.borrowing_book_service.get_borrowed_books
-            )(filters=borrowing_book_interfaces.BorrowedBookFilter())
-
-            total_pages = ceil(len(all_bb) / books_per_page)
-
-            start_index = (page - 1) * books_per_page
-            end_index = start_index + books_per_page
-            books = all_bb[start_index:end_index]
+            borrowed_books = await self.borrowing_book_service.aget_borrowed_books_by_cursor(
+                filters=borrowing_book_interfaces.BorrowedBookFilter(),
+                limit=books_per_page,
+                cursor=cursor
+            )
 
             buttons = [
                 [InlineKeyboardButton(f"{b_book.book_title} by {b_book.username}",
                                       callback_data=f"show-bb_{b_book.id}")]
-                for b_book in books
+                for b_book in borrowed_books.results
             ]
 
             navigation_buttons = []
-            if page > 1:
-                navigation_buttons.append(InlineKeyboardButton("Previous", callback_data=f"bb-page_{page - 1}"))
-            if page < total_pages:
-                navigation_buttons.append(InlineKeyboardButton("Next", callback_data=f"bb-page_{page + 1}"))
+            if borrowed_books.previous_cursor:
+                navigation_buttons.append(
+                    InlineKeyboardButton("Previous", callback_data=f"bb-page_{borrowed_books.previous_cursor}"))
+            if borrowed_books.next_cursor:
+                navigation_buttons.append(
+                    InlineKeyboardButton("Next", callback_data=f"bb-page_{borrowed_books.next_cursor}"))
 
             if navigation_buttons:
                 buttons.append(navigation_buttons)
 
             reply_markup = InlineKeyboardMarkup(buttons)
-            await context.bot.send_message(chat_id=chat_id, text="Here are the borrowed books:",
-                                           reply_markup=reply_markup)
+            await self._reply(update, context, chat_id=chat_id, text="Here are the borrowed books:",
+                              reply_markup=reply_markup)
         except Exception as e:
             logger.error(f"Error fetching book list: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
-                                           text=f"An error occurred while fetching the borrowed books list.: {str(e)}")
+            await self._reply(update, context, chat_id=chat_id,
+                              text=f"An error occurred while fetching the borrowed books list.: {str(e)}")
 
     async def show_book_details(self, update: Update, context: CallbackContext,
                                 user_claim: account_interfaces.UserClaim,
@@ -336,24 +513,25 @@ class TelegramBotService:
         logger.info(f"User {user_claim.username} is viewing details for book {book_title}")
 
         try:
-            book = await sync_to_async(self.borrowing_book_service.get_book_by_title)(book_title)
+            book = await self.borrowing_book_service.aget_book_by_title(book_title)
             message = (f"Title: {book.title}\nWriter: {book.writer}\n"
                        f"Available Quantity: {book.quantity}\nTopic: {book.topic}\npublisher: {book.publisher}"
                        f"\nPublished: {book.date_published}")
 
-            if await sync_to_async(self.borrowing_book_service.has_user_borrowed_book)(user_claim, book_title):
+            if await self.borrowing_book_service.ahas_user_borrowed_book(user_claim, book_title):
                 buttons = [[InlineKeyboardButton("Return", callback_data=f"return_{book.title}")]]
             else:
                 buttons = [[InlineKeyboardButton("Borrow", callback_data=f"borrow_{book.title}")]]
 
             reply_markup = InlineKeyboardMarkup(buttons)
-            await context.bot.send_message(chat_id=chat_id, text=message, reply_markup=reply_markup)
+            await self._reply(update, context, chat_id=chat_id, text=message, reply_markup=reply_markup)
         except borrowing_book_interfaces.BookNotFound:
-            await context.bot.send_message(chat_id=chat_id, text=f"The selected book: {book_title} was not found.")
+            await self._reply(
+                update, context, chat_id=chat_id, text=f"The selected book: {book_title} was not found.")
         except Exception as e:
             logger.error(f"Error fetching book details: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
-                                           text=f"An error occurred while fetching the book details. : {str(e)}")
+            await self._reply(update, context, chat_id=chat_id,
+                              text=f"An error occurred while fetching the book details. : {str(e)}")
 
     async def show_borrowed_book_details(self, update: Update, context: CallbackContext,
                                          user_claim: account_interfaces.UserClaim,
@@ -362,22 +540,27 @@ class TelegramBotService:
         logger.info(f"User {user_claim.username} is viewing details for borrowed book id {borrowed_book_id}")
 
         try:
-            b_book = await sync_to_async(self.borrowing_book_service.get_borrowed_book_by_id)(borrowed_book_id)
+            b_book = await self.borrowing_book_service.aget_borrowed_book_by_id(borrowed_book_id)
             if b_book.return_at:
                 return_at = self.date_time_utils.convert_timestamp_to_date_time(b_book.return_at).get_str_ymd()
             else:
                 return_at = "Not Returned Yet!"
+            if b_book.borrowed_at:
+                borrowed_at = self.date_time_utils.convert_timestamp_to_date_time(b_book.borrowed_at).get_str_ymd()
+            else:
+                borrowed_at = "Unknown"
             message = (f"Book Title: {b_book.book_title}\nBorrowed By: {b_book.username}\n"
-                       f"Borrowed at: {self.date_time_utils.convert_timestamp_to_date_time(b_book.borrowed_at).get_str_ymd()}\n"
+                       f"Borrowed at: {borrowed_at}\n"
                        f"Return at :{return_at}")
-            await context.bot.send_message(chat_id=chat_id, text=message)
+            await self._reply(update, context, chat_id=chat_id, text=message)
 
         except borrowing_book_interfaces.BookNotFound:
-            await context.bot.send_message(chat_id=chat_id, text=f"The selected borrowed book id: {id} was not found.")
+            await self._reply(
+                update, context, chat_id=chat_id, text=f"The selected borrowed book id: {id} was not found.")
         except Exception as e:
             logger.error(f"Error fetching book details: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
-                                           text=f"An error occurred while fetching the book details. : {str(e)}")
+            await self._reply(update, context, chat_id=chat_id,
+                              text=f"An error occurred while fetching the book details. : {str(e)}")
     
     async def show_offered_book_details(self, update: Update, context: CallbackContext,
                                         user_claim: account_interfaces.UserClaim,
@@ -386,8 +569,8 @@ class TelegramBotService:
         logger.info(f"User {user_claim.username} is viewing details for offered book uid {offered_book_uid}")
 
         try:
-            offered_book = await sync_to_async(
-                self.offer_book_service.get_offered_book)(caller=user_claim, uid=offered_book_uid)
+            offered_book = await self.offer_book_service.async_get_offered_book(
+                caller=user_claim, uid=offered_book_uid)
 
 
             message = (
@@ -399,14 +582,18 @@ class TelegramBotService:
                 f'is purchased: {offered_book.is_purchased}\n'
                 f'offered_at: {self.date_time_utils.convert_timestamp_to_date_time(offered_book.offered_at).get_str_ymd()}'
             )
-            await context.bot.send_message(chat_id=chat_id, text=message)
+            await self._reply(update, context, chat_id=chat_id, text=message)
 
         except offer_book_interfaces.OfferedBookNotFound:
-            await context.bot.send_message(chat_id=chat_id, text=f"The selected offered book uid: {offered_book_uid} was not found.")
+            await self._reply(
+                update, context,
+                chat_id=chat_id,
+                text=f"The selected offered book uid: {offered_book_uid} was not found.",
+            )
         except Exception as e:
             logger.error(f"Error fetching offered book details: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
-                                           text=f"An error occurred while fetching the offered book details. : {str(e)}")
+            await self._reply(update, context, chat_id=chat_id,
+                              text=f"An error occurred while fetching the offered book details. : {str(e)}")
 
     async def borrow_book(self, update: Update, context: CallbackContext, user_claim: account_interfaces.UserClaim,
                           book_title: str):
@@ -414,18 +601,19 @@ class TelegramBotService:
         logger.info(f"User {user_claim.username} attempting to borrow book ID: {book_title}")
 
         try:
-            await sync_to_async(self.borrowing_book_service.borrow_book)(
+            await self.borrowing_book_service.aborrow_book(
                 input_data=borrowing_book_interfaces.BorrowBookInput(
                     username=user_claim.username, book_title=book_title)
             )
-            await context.bot.send_message(chat_id=chat_id, text="You have successfully borrowed the book!")
+            await self.sender.send_message(
+                context.bot, chat_id=chat_id, text="You have successfully borrowed the book!")
         except borrowing_book_interfaces.BookNotFound:
-            await context.bot.send_message(chat_id=chat_id, text="The book was not found.")
+            await self.sender.send_message(context.bot, chat_id=chat_id, text="The book was not found.")
         except borrowing_book_interfaces.BookNotAvailableException:
-            await context.bot.send_message(chat_id=chat_id, text='The book is not available now.')
+            await self.sender.send_message(context.bot, chat_id=chat_id, text='The book is not available now.')
         except Exception as e:
             logger.error(f"Error borrowing book: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
+            await self.sender.send_message(context.bot, chat_id=chat_id,
                                            text=f"An error occurred while borrowing the book. : {str(e)}")
 
     async def return_book(self, update: Update, context: CallbackContext, user_claim: account_interfaces.UserClaim,
@@ -434,16 +622,17 @@ class TelegramBotService:
         logger.info(f"User {user_claim.username} attempting to return book ID: {book_title}")
 
         try:
-            await sync_to_async(self.borrowing_book_service.return_book)(
+            await self.borrowing_book_service.areturn_book(
                 input_data=borrowing_book_interfaces.ReturnBookInput(
                     username=user_claim.username, borrowed_book_title=book_title)
             )
-            await context.bot.send_message(chat_id=chat_id, text="You have successfully returned the book!")
+            await self.sender.send_message(
+                context.bot, chat_id=chat_id, text="You have successfully returned the book!")
         except borrowing_book_interfaces.BookNotFound:
-            await context.bot.send_message(chat_id=chat_id, text="The book was not found.")
+            await self.sender.send_message(context.bot, chat_id=chat_id, text="The book was not found.")
         except Exception as e:
             logger.error(f"Error returning book: {str(e)}")
-            await context.bot.send_message(chat_id=chat_id,
+            await self.sender.send_message(context.bot, chat_id=chat_id,
                                            text=f"An error occurred while returning the book. {str(e)}")
 
     async def handle_unknown(self, update: Update, context: CallbackContext, *args):
@@ -453,25 +642,25 @@ class TelegramBotService:
             "Sorry, I didn't understand that command.\n\n"
             f"{self._command_text}"
         )
-        await context.bot.send_message(chat_id=chat_id, text=commands)
+        await self.sender.send_message(context.bot, chat_id=chat_id, text=commands)
 
     async def handle_dismiss(
             self,
             update: Update,
             context: CallbackContext,
             user_claim: account_interfaces.UserClaim,
-            contact: Contact,
             *args
     ):
+        contact = await self._get_contact(user_claim.telegram_id)
         contact.process_uid = None
-        await contact.asave()
+        await self._save_contact(contact)
         chat_id = update.message.chat_id if update.message else update.callback_query.message.chat_id
         logger.debug(f"dismiss the process: {chat_id}")
         commands = (
             "Your process have been dismissed.\n\n"
             f"{self._command_text}"
         )
-        await context.bot.send_message(chat_id=chat_id, text=commands)
+        await self.sender.send_message(context.bot, chat_id=chat_id, text=commands)
 
     async def offer_book_final_step(
             self,
@@ -481,15 +670,14 @@ class TelegramBotService:
             process_uid: str
     ):
         logger.info(f' offer book final step: {process_uid}')
-        process = await Process.objects.aget(uid=process_uid)
-        fields = Field.objects.filter(process=process)
+        fields = await self._get_process_fields(process_uid)
         offer_book_request = offer_book_interfaces.OfferBookRequest(
-            offered_book_title=[field.value async for field in fields if field.name == OFFER_BOOK_TITLE][0],
-            topic=[field.value async for field in fields if field.name == TOPIC][0],
-            author=[field.value async for field in fields if field.name == WRITER][0],
-            publisher=[field.value async for field in fields if field.name == PUBLISHER][0],
+            offered_book_title=fields[OFFER_BOOK_TITLE],
+            topic=fields[TOPIC],
+            author=fields[WRITER],
+            publisher=fields[PUBLISHER],
             proposer=user_claim.username,
-            purchase_link=[field.value async for field in fields if field.name == PURCHASE_LINK][0],
+            purchase_link=fields[PURCHASE_LINK],
         )
         result = await self.offer_book_service.async_add_offer_book(caller=user_claim, request=offer_book_request)
         message = (
@@ -501,19 +689,19 @@ class TelegramBotService:
             f'is purchased: {result.is_purchased}\n'
             f'offered_at: {self.date_time_utils.convert_timestamp_to_date_time(result.offered_at).get_str_ymd()}'
         )
-        await context.bot.send_message(chat_id=update.message.chat_id, text=message)
-        contact = await Contact.objects.aget(chat_id=user_claim.telegram_id)
+        await self.sender.send_message(context.bot, chat_id=update.message.chat_id, text=message)
+        contact = await self._get_contact(user_claim.telegram_id)
         contact.process_uid = None
-        await contact.asave()
+        await self._save_contact(contact)
 
     async def offer_book_process(self, update, context, user_claim):
-        contact = await Contact.objects.aget(chat_id=user_claim.telegram_id)
+        contact = await self._get_contact(user_claim.telegram_id)
         process_uid = str(uuid.uuid4())
         contact.process_uid = process_uid
-        await contact.asave()
-        process = await Process.objects.acreate(
+        await self._save_contact(contact)
+        process = await self.process_store.create(
             uid=process_uid,
-            type=OFFER_BOOK,
+            process_type=OFFER_BOOK,
             status=Process.STATUS_INITIATE,
         )
         logger.info(f'process: {process}')
@@ -558,14 +746,16 @@ class TelegramBotService:
                 buttons.append(navigation_buttons)
 
             reply_markup = InlineKeyboardMarkup(buttons)
-            await context.bot.send_message(
+            await self._reply(
+                update, context,
                 chat_id=chat_id,
                 text="Here are the Offered books:",
                 reply_markup=reply_markup
             )
         except Exception as e:
             logger.error(f"Error fetching book list: {str(e)}")
-            await context.bot.send_message(
+            await self._reply(
+                update, context,
                 chat_id=chat_id,
                 text=f"An error occurred while fetching the offered books list.: {str(e)}"
             )
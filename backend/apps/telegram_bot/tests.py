@@ -0,0 +1,266 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, patch
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+
+from runner.bootstrap import Bootstrapper
+from utils.cache.services import LocalLRUCache
+from .dispatcher import ChatOrderedDispatcher
+from .interfaces import ProcessNotFound
+from .models import Field, Process
+from .process_stores import CacheProcessStore
+from .router import RouteRequest, UpdateRouter
+from .sender import RateLimitedSender, TokenBucket
+from .views import SECRET_TOKEN_HEADER
+
+
+def _update(chat_id, text):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), text=text)
+
+
+class ChatOrderedDispatcherTestCase(IsolatedAsyncioTestCase):
+    async def test_keeps_order_per_chat(self):
+        handled = []
+
+        async def callback(update, context):
+            # the first update of each chat is the slowest one
+            await asyncio.sleep(0.05 if update.text == 0 else 0)
+            handled.append((update.effective_chat.id, update.text))
+
+        dispatcher = ChatOrderedDispatcher(callback=callback, workers_count=4, queue_size=10)
+        for text in range(5):
+            for chat_id in (1, 2, 3):
+                await dispatcher.dispatch(_update(chat_id, text), None)
+        await dispatcher.stop()
+
+        for chat_id in (1, 2, 3):
+            self.assertEqual([text for c, text in handled if c == chat_id], list(range(5)))
+
+    async def test_slow_chat_does_not_block_other_chats(self):
+        handled = []
+        release = asyncio.Event()
+
+        async def callback(update, context):
+            if update.effective_chat.id == 1:
+                await release.wait()
+            handled.append(update.effective_chat.id)
+
+        dispatcher = ChatOrderedDispatcher(callback=callback, workers_count=2, queue_size=10)
+        await dispatcher.dispatch(_update(1, 'slow'), None)
+        await dispatcher.dispatch(_update(2, 'fast'), None)
+        await asyncio.sleep(0.01)
+        self.assertEqual(handled, [2])
+
+        release.set()
+        await dispatcher.stop()
+        self.assertEqual(handled, [2, 1])
+
+    async def test_callback_error_does_not_stop_worker(self):
+        handled = []
+
+        async def callback(update, context):
+            if update.text == 'bad':
+                raise ValueError('bad update')
+            handled.append(update.text)
+
+        dispatcher = ChatOrderedDispatcher(callback=callback, workers_count=1, queue_size=10)
+        await dispatcher.dispatch(_update(1, 'bad'), None)
+        await dispatcher.dispatch(_update(1, 'good'), None)
+        await dispatcher.stop()
+        self.assertEqual(handled, ['good'])
+
+
+class UpdateRouterTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = []
+
+        async def handler(name, update, context, user_claim, *args):
+            self.calls.append((name, args))
+
+        self.router = UpdateRouter(default_handler=lambda *args: handler('unknown', *args))
+        self.router.add_route('/books', lambda *args: handler('books', *args), argument_type=None)
+        self.router.add_route('show', lambda *args: handler('show', *args))
+        self.router.add_route('show-bb', lambda *args: handler('show-bb', *args), argument_type=int)
+
+    async def _route(self, text):
+        await self.router.route(RouteRequest(update=None, context=None, chat_id=1, text=text))
+
+    def test_parse(self):
+        self.assertEqual(UpdateRouter.parse('/books'), ('/books', None))
+        self.assertEqual(UpdateRouter.parse('/books@library_bot now'), ('/books', None))
+        self.assertEqual(UpdateRouter.parse('show_a_b'), ('show', 'a_b'))
+        self.assertEqual(UpdateRouter.parse('hello'), ('hello', None))
+
+    async def test_routes_by_key(self):
+        await self._route('/books')
+        await self._route('show-bb_12')
+        await self._route('show_my_book')
+        await self._route('something else')
+        self.assertEqual(self.calls, [
+            ('books', ()),
+            ('show-bb', (12,)),
+            ('show', ('my_book',)),
+            ('unknown', ()),
+        ])
+
+    def test_duplicated_route(self):
+        with self.assertRaises(ValueError):
+            self.router.add_route('show', lambda *args: None)
+
+    async def test_middlewares_order(self):
+        order = []
+
+        def get_middleware(name):
+            async def middleware(request, call_next):
+                order.append(name)
+                await call_next(request)
+
+            return middleware
+
+        async def handler(update, context, user_claim, *args):
+            order.append('handler')
+
+        router = UpdateRouter(default_handler=handler, middlewares=[get_middleware('global')])
+        router.add_route('/books', handler, middlewares=[get_middleware('route')])
+        await router.route(RouteRequest(update=None, context=None, chat_id=1, text='/books'))
+        self.assertEqual(order, ['global', 'route', 'handler'])
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return len(self.sent)
+
+
+class RateLimitedSenderTestCase(IsolatedAsyncioTestCase):
+    def test_token_bucket_reserves_in_advance(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    async def test_keeps_the_order_of_a_chat(self):
+        bot = FakeBot()
+        sender = RateLimitedSender(global_rate=100, chat_rate=20, chat_burst=1)
+
+        await asyncio.gather(
+            sender.send_message(bot, chat_id=1, text='first'),
+            sender.send_message(bot, chat_id=1, text='second', reply_markup='markup'),
+            sender.send_message(bot, chat_id=1, text='third'),
+            sender.send_message(bot, chat_id=2, text='other chat'),
+        )
+
+        self.assertEqual(bot.sent, [(1, 'first'), (2, 'other chat'), (1, 'second'), (1, 'third')])
+
+
+class CacheProcessStoreTestCase(IsolatedAsyncioTestCase):
+    async def test_keeps_process_state_in_cache(self):
+        store = CacheProcessStore(cache=LocalLRUCache(), timeout=60)
+
+        process = await store.create(uid='uid', process_type='offer_book', status='initiate')
+        await store.add_field(process, 'title', 'a book')
+        process.step_counter += 1
+        await store.save(process)
+
+        stored = await store.get('uid')
+        self.assertEqual(stored.fields, {'title': 'a book'})
+        self.assertEqual(stored.step_counter, 1)
+        with self.assertRaises(ProcessNotFound):
+            await store.get('missing')
+
+
+class CacheProcessStoreFinishTestCase(TransactionTestCase):
+    async def _create_process(self, store: CacheProcessStore):
+        process = await store.create(uid='uid', process_type='offer_book', status='initiate')
+        await store.add_field(process, 'title', 'a book')
+        await store.add_field(process, 'writer', 'a writer')
+        await store.save(process)
+        return process
+
+    async def test_failed_finish_writes_nothing_and_keeps_the_process(self):
+        store = CacheProcessStore(cache=LocalLRUCache(), timeout=60)
+        process = await self._create_process(store)
+
+        with patch.object(Field.objects, 'bulk_create', side_effect=DatabaseError('write failed')):
+            with self.assertRaises(DatabaseError):
+                await store.finish(process)
+
+        self.assertFalse(await Process.objects.filter(uid='uid').aexists())
+        self.assertEqual((await store.get('uid')).fields, process.fields)
+
+        await store.finish(process)
+
+        self.assertEqual(await Field.objects.filter(process__uid='uid').acount(), 2)
+        with self.assertRaises(ProcessNotFound):
+            await store.get('uid')
+
+    async def test_finishing_again_does_not_duplicate_the_process(self):
+        cache = LocalLRUCache()
+        store = CacheProcessStore(cache=cache, timeout=60)
+        process = await self._create_process(store)
+
+        with patch.object(cache, 'delete', side_effect=ConnectionError('cache unavailable')):
+            with self.assertRaises(ConnectionError):
+                await store.finish(process)
+        await store.finish(await store.get('uid'))
+
+        self.assertEqual(await Process.objects.filter(uid='uid').acount(), 1)
+        self.assertEqual(await Field.objects.filter(process__uid='uid').acount(), 2)
+
+
+class TelegramWebhookViewTestCase(SimpleTestCase):
+    def _post(self, update_mode: str, headers: dict = None):
+        service = Bootstrapper(telegram_update_mode=update_mode, telegram_webhook_secret='secret').get_telegram_bot()
+        with patch('apps.telegram_bot.views._get_telegram_bot', return_value=service), \
+                patch.object(service, 'process_webhook_update', AsyncMock()) as process_webhook_update:
+            response = self.client.post(
+                reverse('telegram_webhook'),
+                data=json.dumps({'update_id': 1}),
+                content_type='application/json',
+                headers=headers or {},
+            )
+        return response, process_webhook_update
+
+    def test_accepts_an_update_with_the_secret(self):
+        response, process_webhook_update = self._post('webhook', {SECRET_TOKEN_HEADER: 'secret'})
+
+        self.assertEqual(response.status_code, 200)
+        process_webhook_update.assert_awaited_once_with({'update_id': 1})
+
+    def test_refuses_an_update_without_the_secret(self):
+        for headers in ({}, {SECRET_TOKEN_HEADER: ''}, {SECRET_TOKEN_HEADER: 'wrong'}):
+            response, process_webhook_update = self._post('webhook', headers)
+
+            self.assertEqual(response.status_code, 403)
+            process_webhook_update.assert_not_awaited()
+
+    def test_is_not_served_in_polling_mode(self):
+        response, process_webhook_update = self._post('polling', {SECRET_TOKEN_HEADER: 'secret'})
+
+        self.assertEqual(response.status_code, 404)
+        process_webhook_update.assert_not_awaited()
+
+    def test_one_webhook_connection_handles_updates_before_responding(self):
+        def uses_dispatcher(update_mode, max_connections):
+            return Bootstrapper(
+                telegram_update_mode=update_mode,
+                telegram_webhook_secret='secret',
+                telegram_webhook_max_connections=max_connections,
+            ).get_telegram_bot()._uses_dispatcher()
+
+        self.assertTrue(uses_dispatcher('polling', 1))
+        self.assertFalse(uses_dispatcher('webhook', 1))
+        self.assertTrue(uses_dispatcher('webhook', 40))
+
+    def test_webhook_mode_requires_a_secret(self):
+        with self.assertRaises(ValueError):
+            Bootstrapper(telegram_update_mode='webhook', telegram_webhook_secret='')
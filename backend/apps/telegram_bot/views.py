@@ -0,0 +1,49 @@
+import json
+import logging
+
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseNotFound
+)
+
+from runner.bootstrap import get_bootstrapper
+from .services import UPDATE_MODE_WEBHOOK
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+_telegram_bot = None
+
+
+def _get_telegram_bot():
+    # one bot service (and telegram application) per process, every worker behind the load balancer keeps its own
+    global _telegram_bot
+    if _telegram_bot is None:
+        _telegram_bot = get_bootstrapper().get_telegram_bot()
+    return _telegram_bot
+
+
+async def telegram_webhook(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    service = _get_telegram_bot()
+    if service.update_mode != UPDATE_MODE_WEBHOOK:
+        # updates are polled by the listener, nothing may be posted in their place
+        return HttpResponseNotFound()
+    if not service.is_valid_webhook_secret(request.headers.get(SECRET_TOKEN_HEADER)):
+        logger.info('invalid webhook secret token')
+        return HttpResponseForbidden()
+
+    try:
+        data = json.loads(request.body)
+    except ValueError as e:
+        logger.info(f'invalid webhook body: {e}')
+        return HttpResponseBadRequest()
+
+    await service.process_webhook_update(data)
+    return HttpResponse(status=200)
+
+
+# django 4.2 csrf_exempt decorator does not support coroutine views
+telegram_webhook.csrf_exempt = True
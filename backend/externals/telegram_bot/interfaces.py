@@ -112,6 +112,24 @@ class AbstractTelegramBot(abc.ABC):
     ):
         raise NotImplementedError
 
+    async def set_webhook(
+            self,
+            url,
+            certificate=None,
+            max_connections=None,
+            allowed_updates=None,
+            ip_address=None,
+            drop_pending_updates=None,
+            secret_token=None,
+            *,
+            read_timeout=None,
+            write_timeout=None,
+            connect_timeout=None,
+            pool_timeout=None,
+            api_kwargs=None,
+    ):
+        raise NotImplementedError
+
 
 class AbstractTelegramApplication(abc.ABC):
 
@@ -128,6 +146,14 @@ class AbstractTelegramApplication(abc.ABC):
     def add_handler(self, handler: "AbstractBaseHandler") -> None:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    async def initialize(self) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def process_update(self, update: object) -> None:
+        raise NotImplementedError
+
 
 class AbstractTelegramApplicationFactory(abc.ABC):
     def get_telegram_application(
@@ -1,4 +1,9 @@
 #!/bin/bash
 
 python manage.py collectstatic --noinput
-gunicorn -b 0.0.0.0:8000 --workers 5 runner.wsgi
+if [ "$TELEGRAM_UPDATE_MODE" = "webhook" ]; then
+  # webhook updates are served by async views, run the asgi app
+  gunicorn -b 0.0.0.0:8000 --workers 5 -k uvicorn.workers.UvicornWorker runner.asgi
+else
+  gunicorn -b 0.0.0.0:8000 --workers 5 runner.wsgi
+fi
@@ -0,0 +1,13 @@
+import logging
+
+from django.apps import AppConfig
+
+logger = logging.getLogger(__name__)
+
+
+class RunnerConfig(AppConfig):
+    name = 'runner'
+
+    def ready(self):
+        from . import checks
+        logger.info(f'active configuration: {checks.get_active_configuration()}')
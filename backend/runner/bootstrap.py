@@ -5,10 +5,12 @@ from typing import List
 from apps.account.interfaces import AbstractAccountService
 from apps.account.services import AccountService
 from apps.borrowing_book.interfaces import AbstractLibraryFacade
-from apps.borrowing_book.services import LibraryFacade
+from apps.borrowing_book.services import AsyncLibraryFacade
 from apps.offer_book.interfaces import AbstractOfferBookService
 from apps.offer_book.services import OfferBookService
-from apps.telegram_bot.services import TelegramBotService
+from apps.telegram_bot.process_stores import CacheProcessStore, DatabaseProcessStore
+from apps.telegram_bot.sender import RateLimitedSender
+from apps.telegram_bot.services import TelegramBotService, UPDATE_MODE_POLLING, UPDATE_MODE_WEBHOOK
 # apps abstractions
 
 
@@ -19,7 +21,12 @@ from apps.telegram_bot.services import TelegramBotService
 from externals.telegram_bot.services import TelegramApplicationFactory
 
 # utils
+from utils.cache.services import DjangoCacheProxy, LocalLRUCache, TwoTierCache
 from utils.date_time.services import DateTimeUtils
+from utils.http_requester.interfaces import AbstractHTTPRequester
+from utils.http_requester.services import (
+    CachingHTTPRequester, CircuitBreaker, HttpxHTTPRequester, RequestsHTTPRequester, SessionHTTPRequester
+)
 from utils.number_formatter.services import NumberFormatter
 
 logger = logging.getLogger(__name__)
@@ -46,6 +53,16 @@ class Bootstrapper:
         _number_formatter = kwargs.get('number_formatter', NumberFormatter())
 
         # externals env
+        _http_requester_backend = get_setting('http_requester_backend', default='session', **kwargs)
+        _http_pool_size = int(get_setting('http_pool_size', default=10, **kwargs))
+        _http_keep_alive = get_setting('http_keep_alive', default='True', **kwargs) == 'True'
+        # seconds to wait for a base address before also trying the next one, unset tries them in turn
+        _http_hedge_delay = get_setting('http_hedge_delay', **kwargs)
+        _http_circuit_failure_threshold = int(get_setting('http_circuit_failure_threshold', default=3, **kwargs))
+        _http_circuit_reset_timeout = float(get_setting('http_circuit_reset_timeout', default=30, **kwargs))
+        # responses cached for GET requests, 0 disables the cache
+        _http_cache_size = int(get_setting('http_cache_size', default=1000, **kwargs))
+        _http_cache_default_max_age = int(get_setting('http_cache_default_max_age', default='0', **kwargs))
 
         # apps env
         _telegram_base_address = get_setting('telegram_base_address', default='https://api.telegram.org/bot', **kwargs)
@@ -53,13 +70,85 @@ class Bootstrapper:
                                              **kwargs)
         _telegram_proxy = get_setting('telegram_proxy', **kwargs)
         _telegram_bot_token = get_setting('telegram_bot_token', **kwargs)
+        _telegram_update_mode = get_setting('telegram_update_mode', default=UPDATE_MODE_POLLING, **kwargs)
+        _telegram_webhook_url = get_setting('telegram_webhook_url', **kwargs)
+        _telegram_webhook_secret = get_setting('telegram_webhook_secret', **kwargs)
+        # 1 keeps the updates of a chat in order across the worker processes, at the cost of parallelism
+        _telegram_webhook_max_connections = int(get_setting('telegram_webhook_max_connections', default=1, **kwargs))
+        _telegram_dispatcher_workers = int(get_setting('telegram_dispatcher_workers', default=8, **kwargs))
+        _telegram_dispatcher_queue_size = int(get_setting('telegram_dispatcher_queue_size', default=100, **kwargs))
+        _telegram_contact_cache_size = int(get_setting('telegram_contact_cache_size', default=10000, **kwargs))
+        _telegram_contact_cache_timeout = int(get_setting('telegram_contact_cache_timeout', default=300, **kwargs))
+        _telegram_process_state_backend = get_setting('telegram_process_state_backend', default='database', **kwargs)
+        _telegram_process_state_timeout = int(get_setting('telegram_process_state_timeout', default=3600, **kwargs))
+        _telegram_global_rate = float(get_setting('telegram_global_rate', default=30, **kwargs))
+        _telegram_chat_rate = float(get_setting('telegram_chat_rate', default=1, **kwargs))
+        _telegram_chat_burst = float(get_setting('telegram_chat_burst', default=3, **kwargs))
+        _user_claim_cache_size = int(get_setting('user_claim_cache_size', default=10000, **kwargs))
+        # bounds how long another process may see a user claim deleted through this one
+        _user_claim_local_timeout = int(get_setting('user_claim_local_timeout', default=60, **kwargs))
+        _user_claim_timeout = int(get_setting('user_claim_timeout', default=24 * 60 * 60, **kwargs))
+        _user_not_found_timeout = int(get_setting('user_not_found_timeout', default=60, **kwargs))
         # _telegram_admin_user_ids = get_list_setting('telegram_admin_user_ids', **kwargs)
 
         # externals
+        _http_failover = dict(
+            hedge_delay=float(_http_hedge_delay) if _http_hedge_delay else None,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=_http_circuit_failure_threshold,
+                reset_timeout=_http_circuit_reset_timeout,
+            ),
+        )
+        if _http_requester_backend == 'httpx':
+            _http_requester = HttpxHTTPRequester(
+                max_connections=_http_pool_size,
+                max_keepalive_connections=_http_pool_size if _http_keep_alive else 0,
+                **_http_failover
+            )
+        elif _http_requester_backend == 'session':
+            _http_requester = SessionHTTPRequester(
+                pool_maxsize=_http_pool_size, keep_alive=_http_keep_alive, **_http_failover
+            )
+        else:
+            _http_requester = RequestsHTTPRequester(**_http_failover)
+        if _http_cache_size:
+            _http_requester = CachingHTTPRequester(
+                requester=_http_requester,
+                cache=LocalLRUCache(max_size=_http_cache_size),
+                default_max_age=_http_cache_default_max_age,
+            )
+        self._http_requester = kwargs.get('http_requester', _http_requester)
         _telegram_application_factory = kwargs.get('telegram_application_factory', TelegramApplicationFactory())
 
-        self._account_service = kwargs.get('account_service', AccountService())
-        self._borrowing_book_service = kwargs.get('borrowing_book_service', LibraryFacade(
+        if _telegram_process_state_backend == 'cache':
+            _telegram_process_store = CacheProcessStore(
+                cache=DjangoCacheProxy(),
+                timeout=_telegram_process_state_timeout,
+            )
+        else:
+            _telegram_process_store = DatabaseProcessStore()
+
+        if _telegram_update_mode == UPDATE_MODE_WEBHOOK:
+            # every asgi worker serves the webhook, a contact saved by one of them must be seen by the others,
+            # so it is only as consistent as CACHE_BACKEND is shared (see runner.W004)
+            _telegram_contact_cache = DjangoCacheProxy()
+        else:
+            # polling runs in a single process, which is the only writer of its contacts
+            _telegram_contact_cache = LocalLRUCache(
+                max_size=_telegram_contact_cache_size,
+                default_timeout=_telegram_contact_cache_timeout,
+            )
+
+        self._account_service = kwargs.get('account_service', AccountService(
+            user_claim_cache=kwargs.get('user_claim_cache', TwoTierCache(
+                local=LocalLRUCache(max_size=_user_claim_cache_size),
+                shared=DjangoCacheProxy(),
+                local_timeout=_user_claim_local_timeout,
+            )),
+            user_claim_timeout=_user_claim_timeout,
+            user_not_found_timeout=_user_not_found_timeout,
+        ))
+        self._borrowing_book_service = kwargs.get('borrowing_book_service', AsyncLibraryFacade(
             date_time_utils=_date_time_utils,
         ))
         self._offer_book_service = kwargs.get("offer_book_service", OfferBookService(
@@ -76,10 +165,27 @@ class Bootstrapper:
                 borrowing_book=self._borrowing_book_service,
                 offer_book=self._offer_book_service,
                 date_time_utils=_date_time_utils,
+                contact_cache=kwargs.get('telegram_contact_cache', _telegram_contact_cache),
+                contact_cache_timeout=_telegram_contact_cache_timeout,
+                process_store=kwargs.get('telegram_process_store', _telegram_process_store),
+                sender=kwargs.get('telegram_sender', RateLimitedSender(
+                    global_rate=_telegram_global_rate,
+                    chat_rate=_telegram_chat_rate,
+                    chat_burst=_telegram_chat_burst,
+                )),
                 token=_telegram_bot_token,
+                update_mode=_telegram_update_mode,
+                webhook_url=_telegram_webhook_url,
+                webhook_secret=_telegram_webhook_secret,
+                webhook_max_connections=_telegram_webhook_max_connections,
+                dispatcher_workers=_telegram_dispatcher_workers,
+                dispatcher_queue_size=_telegram_dispatcher_queue_size,
             )
                                        )
 
+    def get_http_requester(self) -> AbstractHTTPRequester:
+        return self._http_requester
+
     def get_account_service(self) -> AbstractAccountService:
         return self._account_service
 
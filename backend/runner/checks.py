@@ -0,0 +1,61 @@
+import os
+
+from django.conf import settings
+from django.core import checks
+
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.redis.RedisCache',
+)
+
+
+def get_active_configuration() -> dict:
+    cache = settings.CACHES['default']
+    database = settings.DATABASES['default']
+    return {
+        'cache_backend': cache['BACKEND'],
+        'cache_location': cache.get('LOCATION'),
+        'database_engine': database['ENGINE'],
+        'database_host': database.get('HOST'),
+        'conn_max_age': database.get('CONN_MAX_AGE', 0),
+        'conn_health_checks': database.get('CONN_HEALTH_CHECKS', False),
+    }
+
+
+@checks.register(checks.Tags.caches)
+def check_active_configuration(app_configs, **kwargs):
+    """
+        warns about a configuration that works on one process but not on the deployed ones
+    """
+    configuration = get_active_configuration()
+    errors = []
+    if (configuration['cache_backend'] not in SHARED_CACHE_BACKENDS
+            and os.getenv('TELEGRAM_PROCESS_STATE_BACKEND') == 'cache'):
+        errors.append(checks.Warning(
+            f"in-flight bot processes are kept in {configuration['cache_backend']}, which is not shared "
+            f"between processes and is lost on restart",
+            hint='set CACHE_BACKEND to redis or file',
+            id='runner.W001',
+        ))
+    if (configuration['cache_backend'] not in SHARED_CACHE_BACKENDS
+            and os.getenv('TELEGRAM_UPDATE_MODE') == 'webhook'):
+        errors.append(checks.Warning(
+            f"bot contacts are cached in {configuration['cache_backend']}, which is not shared between the asgi "
+            f"workers, a contact updated by one worker stays stale on the others",
+            hint='set CACHE_BACKEND to redis or file',
+            id='runner.W004',
+        ))
+    if configuration['conn_max_age'] and os.getenv('TELEGRAM_UPDATE_MODE') == 'webhook':
+        errors.append(checks.Warning(
+            'persistent database connections are enabled while the app is served by asgi',
+            hint='set DB_CONN_MAX_AGE to 0',
+            id='runner.W002',
+        ))
+    if configuration['conn_max_age'] and not configuration['conn_health_checks']:
+        errors.append(checks.Warning(
+            'persistent database connections are enabled without health checks, a connection closed by the '
+            'server fails the next request of its thread',
+            hint='set DB_CONN_HEALTH_CHECKS to True',
+            id='runner.W003',
+        ))
+    return errors
@@ -47,7 +47,8 @@ INSTALLED_APPS = [
     'apps.borrowing_book',
     'apps.account',
     'apps.telegram_bot',
-    'apps.offer_book'
+    'apps.offer_book',
+    'runner.apps.RunnerConfig',
 ]
 
 MIDDLEWARE = [
@@ -94,6 +95,13 @@ DATABASES = {
         'PASSWORD': os.getenv("DB_PASSWORD", ''),
         'HOST': os.getenv("DB_HOST", ''),
         'PORT': os.getenv("DB_PORT", ''),
+        # seconds a connection is kept for the next requests of its thread, 0 closes it after each request.
+        # disabled by default under asgi (webhook mode), connections of async requests are not reused there.
+        'CONN_MAX_AGE': int(os.getenv(
+            "DB_CONN_MAX_AGE", '0' if os.getenv("TELEGRAM_UPDATE_MODE") == 'webhook' else '60'
+        )),
+        # pings a reused connection once per request instead of failing on one closed by the server
+        'CONN_HEALTH_CHECKS': os.getenv("DB_CONN_HEALTH_CHECKS", 'True') == 'True',
         'TEST': {
             'OPTIONS': {
                 "init_command": "SET GLOBAL max_connections = 100000",
@@ -102,6 +110,34 @@ DATABASES = {
     }
 }
 
+# Cache
+# CACHE_BACKEND is one of locmem (per process), file (shared by the processes of a host)
+# or redis (any redis-compatible server, shared by all hosts)
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'book-library',
+    'file': '/tmp/book-library-cache',
+    'redis': f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', '6379')}/"
+             f"{os.getenv('REDIS_DB', '0')}",
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'library'),
+        # redis evicts by its own maxmemory policy
+        'OPTIONS': {} if CACHE_BACKEND == 'redis' else {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000'))},
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
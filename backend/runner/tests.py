@@ -0,0 +1,46 @@
+import importlib
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from utils.cache.services import DjangoCacheProxy, LocalLRUCache
+from . import settings as runner_settings
+from .bootstrap import Bootstrapper
+
+
+class BootstrapperTestCase(SimpleTestCase):
+    def test_builds_with_default_settings(self):
+        with patch.dict(os.environ, {}, clear=True):
+            bootstrapper = Bootstrapper()
+
+        self.assertIsNotNone(bootstrapper.get_http_requester())
+        self.assertIsNotNone(bootstrapper.get_telegram_bot())
+
+    def test_webhook_mode_shares_the_contact_cache(self):
+        environ = {'TELEGRAM_UPDATE_MODE': 'webhook', 'TELEGRAM_WEBHOOK_SECRET': 'secret'}
+        with patch.dict(os.environ, environ, clear=True):
+            bootstrapper = Bootstrapper()
+
+        self.assertIsInstance(bootstrapper.get_telegram_bot().contact_cache, DjangoCacheProxy)
+
+    def test_polling_mode_keeps_the_contact_cache_local(self):
+        with patch.dict(os.environ, {}, clear=True):
+            bootstrapper = Bootstrapper()
+
+        self.assertIsInstance(bootstrapper.get_telegram_bot().contact_cache, LocalLRUCache)
+
+
+class SettingsTestCase(SimpleTestCase):
+    def _load_settings(self, environ: dict):
+        self.addCleanup(importlib.reload, runner_settings)
+        with patch.dict(os.environ, environ, clear=True):
+            return importlib.reload(runner_settings)
+
+    def test_webhook_mode_closes_database_connections(self):
+        settings = self._load_settings({'TELEGRAM_UPDATE_MODE': 'webhook'})
+        self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+    def test_polling_mode_keeps_database_connections(self):
+        settings = self._load_settings({})
+        self.assertEqual(settings.DATABASES['default']['CONN_MAX_AGE'], 60)
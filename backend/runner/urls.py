@@ -6,6 +6,7 @@ from django.views.static import serve
 
 urlpatterns = [
     path('admin' + '/', admin.site.urls),
+    path('telegram/', include('apps.telegram_bot.urls')),
     re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
 ]
 
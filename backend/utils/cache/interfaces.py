@@ -11,3 +11,12 @@ class AbstractCache(abc.ABC):
 
     def delete(self, cache_key):
         raise NotImplementedError
+
+    async def aget(self, cache_key, default=None):
+        return self.get(cache_key, default)
+
+    async def aset(self, cache_key: str, value, timeout=None):
+        self.set(cache_key, value, timeout=timeout)
+
+    async def adelete(self, cache_key):
+        self.delete(cache_key)
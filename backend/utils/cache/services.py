@@ -1,4 +1,9 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
 from django.core.cache import cache as django_cache
 from . import interfaces
 
@@ -22,3 +27,121 @@ class DjangoCacheProxy(interfaces.AbstractCache):
         logger.info(f"cache key:{cache_key}")
         django_cache.delete(cache_key)
 
+
+    async def aget(self, cache_key, default=None):
+        logger.info(f"cache key:{cache_key},default:{default}")
+        result = await django_cache.aget(cache_key)
+        if result is None:
+            result = default
+        logger.info(f"result:{result}")
+        return result
+
+    async def aset(self, cache_key: str, value, timeout=None):
+        logger.info(f"cache key:{cache_key},value:{value},timeout:{timeout}")
+        await django_cache.aset(cache_key, value, timeout=timeout)
+
+    async def adelete(self, cache_key: str):
+        logger.info(f"cache key:{cache_key}")
+        await django_cache.adelete(cache_key)
+
+
+class LocalLRUCache(interfaces.AbstractCache):
+    """
+        process-local and thread-safe cache. keeps at most max_size keys, evicting the least recently used one,
+        and drops keys older than their timeout (seconds) on access.
+    """
+
+    def __init__(self, max_size: int = 1000, default_timeout: Optional[float] = None):
+        self.max_size = max_size
+        self.default_timeout = default_timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key, default=None):
+        with self._lock:
+            item = self._items.get(cache_key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._items[cache_key]
+                return default
+            self._items.move_to_end(cache_key)
+            return value
+
+    def set(self, cache_key: str, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._items[cache_key] = (value, expires_at)
+            self._items.move_to_end(cache_key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, cache_key: str):
+        with self._lock:
+            self._items.pop(cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class TwoTierCache(interfaces.AbstractCache):
+    """
+        a process-local cache in front of a shared one, hits of the local tier do not leave the process.
+        deleting a key only clears the local tier of this process, so local_timeout (seconds) bounds how long
+        other processes may still serve it.
+    """
+
+    def __init__(
+            self,
+            local: interfaces.AbstractCache,
+            shared: interfaces.AbstractCache,
+            local_timeout: Optional[float] = None,
+    ):
+        self.local = local
+        self.shared = shared
+        self.local_timeout = local_timeout
+
+    def _get_local_timeout(self, timeout=None):
+        if timeout is None or self.local_timeout is None:
+            return self.local_timeout if timeout is None else timeout
+        return min(timeout, self.local_timeout)
+
+    def get(self, cache_key, default=None):
+        result = self.local.get(cache_key)
+        if result is None:
+            result = self.shared.get(cache_key)
+            if result is None:
+                return default
+            self.local.set(cache_key, result, timeout=self._get_local_timeout())
+        return result
+
+    def set(self, cache_key: str, value, timeout=None):
+        self.shared.set(cache_key, value, timeout=timeout)
+        self.local.set(cache_key, value, timeout=self._get_local_timeout(timeout))
+
+    def delete(self, cache_key: str):
+        self.shared.delete(cache_key)
+        self.local.delete(cache_key)
+
+    async def aget(self, cache_key, default=None):
+        result = self.local.get(cache_key)
+        if result is None:
+            result = await self.shared.aget(cache_key)
+            if result is None:
+                return default
+            self.local.set(cache_key, result, timeout=self._get_local_timeout())
+        return result
+
+    async def aset(self, cache_key: str, value, timeout=None):
+        await self.shared.aset(cache_key, value, timeout=timeout)
+        self.local.set(cache_key, value, timeout=self._get_local_timeout(timeout))
+
+    async def adelete(self, cache_key: str):
+        await self.shared.adelete(cache_key)
+        self.local.delete(cache_key)
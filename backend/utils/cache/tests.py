@@ -0,0 +1,64 @@
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from .services import LocalLRUCache, TwoTierCache
+
+
+class LocalLRUCacheTestCase(TestCase):
+    def test_get_and_set(self):
+        cache = LocalLRUCache(max_size=2)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', default=0), 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_timeout(self):
+        cache = LocalLRUCache(max_size=2, default_timeout=0.01)
+        cache.set('a', 1)
+        cache.set('b', 2, timeout=60)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_delete(self):
+        cache = LocalLRUCache()
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('missing')
+        self.assertIsNone(cache.get('a'))
+
+
+class TwoTierCacheTestCase(IsolatedAsyncioTestCase):
+    async def test_reads_through_the_local_tier(self):
+        shared = LocalLRUCache()
+        cache = TwoTierCache(local=LocalLRUCache(), shared=shared, local_timeout=60)
+        shared.set('a', 1)
+
+        self.assertEqual(await cache.aget('a'), 1)
+        shared.delete('a')
+        self.assertEqual(await cache.aget('a'), 1)
+        self.assertEqual(await cache.aget('b', default=0), 0)
+
+    async def test_set_and_delete_both_tiers(self):
+        local, shared = LocalLRUCache(), LocalLRUCache()
+        cache = TwoTierCache(local=local, shared=shared, local_timeout=0.01)
+
+        await cache.aset('a', 1, timeout=60)
+        self.assertEqual((local.get('a'), shared.get('a')), (1, 1))
+        time.sleep(0.02)
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(await cache.aget('a'), 1)
+
+        await cache.adelete('a')
+        self.assertIsNone(await cache.aget('a'))
+        self.assertIsNone(shared.get('a'))
@@ -1,5 +1,5 @@
 import abc
-from typing import List
+from typing import Iterator, List, Tuple
 
 from pydantic import BaseModel
 
@@ -21,3 +21,14 @@ class CurrencyRowList(BaseModel):
 class AbstractImageGenerator(abc.ABC):
     def draw_rows_in_picture(self, data_rows: CurrencyRowList) -> str:
         raise NotImplementedError
+
+    def draw_many(self, data_rows_list: List[CurrencyRowList]) -> List[bytes]:
+        """returns the images of data_rows_list in its order
+        """
+        return [self.draw_rows_in_picture(data_rows) for data_rows in data_rows_list]
+
+    def iter_draw_many(self, data_rows_list: List[CurrencyRowList]) -> Iterator[Tuple[int, bytes]]:
+        """yields (index in data_rows_list, image) of each image as soon as it is ready, not in order
+        """
+        for index, data_rows in enumerate(data_rows_list):
+            yield index, self.draw_rows_in_picture(data_rows)
@@ -1,10 +1,14 @@
+import hashlib
+import json
 import logging
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 from PIL import Image, ImageDraw, ImageFont
-from PIL.ImageFile import ImageFile
 
 import arabic_reshaper
+from utils.cache import interfaces as cache_interfaces
+from utils.cache.services import LocalLRUCache
 from utils.date_time import interfaces as date_time_interfaces
 from utils.number_formatter import interfaces as number_formatter_interfaces
 from . import interfaces
@@ -13,6 +17,58 @@ from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
+ICONS_DIRECTORY = './png250px/'
+HEADERS = ["وضعیت", "مانده حساب", "نام ارز", "*"]
+
+# Define colors
+HEADER_BG_COLOR = (200, 200, 200)
+ROW_BG_COLOR_1 = (240, 240, 240)
+ROW_BG_COLOR_2 = (255, 255, 255)
+BORDER_COLOR = (255, 255, 255)
+TEXT_COLOR = (50, 50, 50)
+
+
+class ImageAssetCache:
+    """
+        process-wide cache of the loaded fonts, per path and size, and of the flag icons, resized and converted
+        to RGBA once per size together with their alpha masks. the least recently used ones are evicted.
+    """
+
+    def __init__(self, max_fonts: int = 16, max_icons: int = 512):
+        self._fonts = LocalLRUCache(max_size=max_fonts)
+        self._icons = LocalLRUCache(max_size=max_icons)
+
+    def get_font(self, font_path: str, size: int):
+        cache_key = f'{font_path}:{size}'
+        font = self._fonts.get(cache_key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(font_path, size)
+            except IOError:
+                font = ImageFont.load_default()
+            self._fonts.set(cache_key, font)
+        return font
+
+    def get_icon(self, icon_path: str, size: Tuple[int, int]) -> Tuple[Image.Image, Image.Image]:
+        cache_key = f'{icon_path}:{size[0]}x{size[1]}'
+        icon = self._icons.get(cache_key)
+        if icon is None:
+            with Image.open(icon_path) as icon_file:
+                image = icon_file.resize(size, Image.LANCZOS).convert('RGBA')
+            icon = (image, image.getchannel('A'))
+            self._icons.set(cache_key, icon)
+        return icon
+
+
+default_asset_cache = ImageAssetCache()
+
+
+class _TableRow(NamedTuple):
+    status: str
+    balance: str
+    currency_symbol: str
+    icon_path: str
+
 
 class CurrencyImageGeneratorService(interfaces.AbstractImageGenerator):
     def __init__(
@@ -26,7 +82,17 @@ class CurrencyImageGeneratorService(interfaces.AbstractImageGenerator):
             cell_width: int = 200,
             cell_height: int = 50,
             n_cols: int = 4,
+            asset_cache: ImageAssetCache = None,
+            render_cache: cache_interfaces.AbstractCache = None,
+            workers_count: int = 0,
+            use_templates: bool = True,
+            max_templates: int = 64,
+            icons_directory: str = ICONS_DIRECTORY,
     ):
+        """
+            workers_count processes render the images of draw_many, 0 renders them on the calling thread.
+            the processes can not be started from a daemonic process, like a worker of celery's prefork pool.
+        """
         self.image_width = image_width
         self.cell_width = cell_width
         self.cell_height = cell_height
@@ -37,37 +103,143 @@ class CurrencyImageGeneratorService(interfaces.AbstractImageGenerator):
         self.country_mappings = country_mappings
         self.date_time_utils = date_time_utils
         self.number_formatter = number_formatter
+        self.asset_cache = asset_cache or default_asset_cache
+        # encoded images by the hash of their content, None renders every call
+        self.render_cache = render_cache
+        self.workers_count = workers_count
+        self.use_templates = use_templates
+        self._templates = LocalLRUCache(max_size=max_templates)
+        self.icons_directory = icons_directory
+        # to build the generator of each worker process, caches are per process
+        self._worker_kwargs = dict(
+            english_font_path=english_font_path,
+            farsi_font_path=farsi_font_path,
+            country_mappings=country_mappings,
+            date_time_utils=date_time_utils,
+            number_formatter=number_formatter,
+            image_width=image_width,
+            cell_width=cell_width,
+            cell_height=cell_height,
+            n_cols=n_cols,
+            use_templates=use_templates,
+            max_templates=max_templates,
+            icons_directory=icons_directory,
+        )
+        self._pool = None
 
     def draw_rows_in_picture(self, data_rows: interfaces.CurrencyRowList):
-        n_rows = len(data_rows.rows)
-        image_height = (n_rows + 2) * 50
+        name, date, rows = self._prepare(data_rows)
+        if self.render_cache is None:
+            return self._draw(name, date, rows)
+
+        cache_key = self._get_render_cache_key(name, date, rows)
+        image_bytes = self.render_cache.get(cache_key)
+        if image_bytes is None:
+            image_bytes = self._draw(name, date, rows)
+            self.render_cache.set(cache_key, image_bytes)
+        return image_bytes
+
+    def draw_many(self, data_rows_list: List[interfaces.CurrencyRowList]) -> List[bytes]:
+        images = [None] * len(data_rows_list)
+        for index, image_bytes in self.iter_draw_many(data_rows_list):
+            images[index] = image_bytes
+        return images
+
+    def iter_draw_many(self, data_rows_list: List[interfaces.CurrencyRowList]) -> Iterator[Tuple[int, bytes]]:
+        # equal tables of the batch are rendered once
+        tables = {}
+        for index, data_rows in enumerate(data_rows_list):
+            table = self._prepare(data_rows)
+            tables.setdefault(self._get_render_cache_key(*table), (table, []))[1].append(index)
+
+        to_draw = {}
+        for cache_key, (table, indexes) in tables.items():
+            image_bytes = self.render_cache.get(cache_key) if self.render_cache is not None else None
+            if image_bytes is None:
+                to_draw[cache_key] = table
+                continue
+            for index in indexes:
+                yield index, image_bytes
+
+        if self.workers_count:
+            futures = {self._get_pool().submit(_draw_in_worker, *table): key for key, table in to_draw.items()}
+            drawn = ((futures[future], future.result()) for future in as_completed(futures))
+        else:
+            drawn = ((key, self._draw(*table)) for key, table in to_draw.items())
+        for cache_key, image_bytes in drawn:
+            if self.render_cache is not None:
+                self.render_cache.set(cache_key, image_bytes)
+            for index in tables[cache_key][1]:
+                yield index, image_bytes
+
+    def warm_up(self):
+        """
+            loads the fonts and the flags of all mapped currencies into the asset cache
+        """
+        self.asset_cache.get_font(self.english_font_path, 15)
+        self.asset_cache.get_font(self.farsi_font_path, 15)
+        for file in set(self.country_mappings.values()):
+            try:
+                self.asset_cache.get_icon(self.icons_directory + file + '.png', self._get_icon_size())
+            except IOError as e:
+                logger.warning(f'flag icon of {file} not loaded: {e}')
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # started once and kept, so its workers stay warm between batches
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers_count,
+                initializer=_init_worker,
+                initargs=(self._worker_kwargs,),
+            )
+        return self._pool
+
+    def _prepare(self, data_rows: interfaces.CurrencyRowList) -> Tuple[str, str, List[_TableRow]]:
         date = self.date_time_utils.convert_timestamp_to_date_time(
             timestamp=data_rows.timestamp,
             calendar_type=date_time_interfaces.CalendarType.JALALI,
         )
         date = f'{date.year}/{date.month}/{date.day}   {date.hour}:{date.minute}'
-        image = Image.new("RGB", (self.image_width, image_height), "white")
+        rows = [
+            _TableRow(
+                status=f"{row.status}",
+                balance=f"{self.number_formatter.format_decimal(row.balance)}",
+                currency_symbol=f"{row.currency_symbol}",
+                icon_path=self._get_icon_path(row.currency_symbol),
+            ) for row in data_rows.rows
+        ]
+        return data_rows.name, date, rows
+
+    def _get_icon_size(self) -> Tuple[int, int]:
+        return int(self.cell_width * 0.3), int(self.cell_height * 0.6)
+
+    def _get_render_cache_key(self, name: str, date: str, rows: List[_TableRow]) -> str:
+        """
+            hashes what the image is drawn from: the texts of its cells, its flags and the layout, so tables of
+            different timestamps in the same minute or of equal formatted balances share one image
+        """
+        layout = [self.image_width, self.cell_width, self.cell_height, self.n_cols, self.english_font_path,
+                  self.farsi_font_path]
+        content = json.dumps([layout, name, date, rows], ensure_ascii=False)
+        return f'currency_image_{hashlib.sha256(content.encode()).hexdigest()}'
+
+    def _draw(self, name: str, date: str, rows: List[_TableRow]) -> bytes:
+        n_rows = len(rows)
+        if self.use_templates:
+            image = self._get_template(n_rows).copy()
+        else:
+            image = self._draw_template(n_rows)
         draw = ImageDraw.Draw(image)
 
-        try:
-            english_font = ImageFont.truetype(self.english_font_path, 15)
-            farsi_font = ImageFont.truetype(self.farsi_font_path, 15)
-        except IOError:
-            english_font = farsi_font = ImageFont.load_default()
-
-        # Define colors
-        header_bg_color = (200, 200, 200)
-        row_bg_color_1 = (240, 240, 240)
-        row_bg_color_2 = (255, 255, 255)
-        border_color = (255, 255, 255)
-        text_color = (50, 50, 50)
-
-        headers = ["وضعیت", "مانده حساب", "نام ارز", "*"]
-        headers = [arabic_reshaper.reshape(header) for header in headers]
-
-        draw.rectangle([0, 0, self.image_width / 2, self.cell_height], fill=header_bg_color)
-        draw.rectangle([self.image_width / 2, 0, self.image_width, self.cell_height], fill=header_bg_color)
-        bbox_name = draw.textbbox((0, 0), data_rows.name, font=english_font)
+        english_font = self.asset_cache.get_font(self.english_font_path, 15)
+        icon_size = self._get_icon_size()
+
+        bbox_name = draw.textbbox((0, 0), name, font=english_font)
         bbox_date = draw.textbbox((0, 0), date, font=english_font)
         text_width_name, text_height_name = bbox_name[2] - bbox_name[0], bbox_name[3] - bbox_name[1]
         text_width_date, text_height_date = bbox_date[2] - bbox_date[0], bbox_date[3] - bbox_date[1]
@@ -75,62 +247,27 @@ class CurrencyImageGeneratorService(interfaces.AbstractImageGenerator):
         text_y_name = (self.cell_height - text_height_name) / 2
         text_x_date = (self.image_width / 2 - text_width_date) / 2 + self.image_width / 2
         text_y_date = (self.cell_height - text_height_date) / 2
-        draw.text((text_x_name, text_y_name), data_rows.name, fill=text_color, font=english_font)
-        draw.text((text_x_date, text_y_date), date, fill=text_color, font=english_font)
-
-        # Draw table headers
-        for col in range(self.n_cols):
-            x1 = col * self.cell_width
-            y1 = self.cell_height
-            x2 = (col + 1) * self.cell_width
-            y2 = 2 * self.cell_height
-            draw.rectangle([x1, y1, x2, y2], fill=header_bg_color, outline=border_color)
-            header_text = headers[col]
-            bbox = draw.textbbox((0, 0), header_text, font=farsi_font)
-            text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            text_x = x1 + (self.cell_width - text_width) / 2
-            text_y = y1 + (self.cell_height - text_height) / 2
-            draw.text((text_x, text_y), header_text, fill=text_color, font=farsi_font)
+        draw.text((text_x_name, text_y_name), name, fill=TEXT_COLOR, font=english_font)
+        draw.text((text_x_date, text_y_date), date, fill=TEXT_COLOR, font=english_font)
 
         # Draw table rows
         for row in range(1, n_rows + 1):
-            bg_color = row_bg_color_1 if row % 2 == 1 else row_bg_color_2
+            y1 = (row + 1) * self.cell_height
             for col in range(self.n_cols):
                 x1 = col * self.cell_width
-                y1 = (row + 1) * self.cell_height
-                x2 = (col + 1) * self.cell_width
-                y2 = (row + 2) * self.cell_height
-                draw.rectangle([x1, y1, x2, y2], fill=bg_color, outline=border_color)
-
                 if col == 3:  # Last column, draw the flag
-                    icon_file = self._find_icon_file(data_rows.rows[row - 1].currency_symbol)
-                    icon_size = (int(self.cell_width * 0.3), int(self.cell_height * 0.6))
-                    icon_file = icon_file.resize(icon_size, Image.LANCZOS)
+                    icon, icon_mask = self.asset_cache.get_icon(
+                        rows[row - 1].icon_path, icon_size
+                    )
                     icon_x = x1 + (self.cell_width - icon_size[0]) // 2
                     icon_y = y1 + (self.cell_height - icon_size[1]) // 2
-                    image.paste(icon_file, (icon_x, icon_y), icon_file.convert('RGBA'))
+                    image.paste(icon, (icon_x, icon_y), icon_mask)
                 elif col == 2:
-                    cell_text = f"{data_rows.rows[row - 1].currency_symbol}"
-                    bbox = draw.textbbox((0, 0), cell_text, font=english_font)
-                    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-                    text_x = x1 + (self.cell_width - text_width) / 2
-                    text_y = y1 + (self.cell_height - text_height) / 2
-                    draw.text((text_x, text_y), cell_text, fill=text_color, font=english_font)
+                    self._draw_cell_text(draw, rows[row - 1].currency_symbol, english_font, x1, y1)
                 elif col == 1:
-                    cell_text = f"{self.number_formatter.format_decimal(data_rows.rows[row - 1].balance)}"
-                    bbox = draw.textbbox((0, 0), cell_text, font=english_font)
-                    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-                    text_x = x1 + (self.cell_width - text_width) / 2
-                    text_y = y1 + (self.cell_height - text_height) / 2
-                    draw.text((text_x, text_y), cell_text, fill=text_color, font=english_font)
+                    self._draw_cell_text(draw, rows[row - 1].balance, english_font, x1, y1)
                 elif col == 0:
-                    cell_text = f"{data_rows.rows[row - 1].status}"
-                    bbox = draw.textbbox((0, 0), cell_text, font=english_font)
-                    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-                    text_x = x1 + (self.cell_width - text_width) / 2
-                    text_y = y1 + (self.cell_height - text_height) / 2
-                    draw.text((text_x, text_y), cell_text, fill=text_color, font=english_font)
-
+                    self._draw_cell_text(draw, rows[row - 1].status, english_font, x1, y1)
 
         buffer = BytesIO()
         image.save(buffer, format='PNG')
@@ -139,12 +276,68 @@ class CurrencyImageGeneratorService(interfaces.AbstractImageGenerator):
 
         return image_bytes
 
-    def _find_icon_file(self, currency_code: str) -> ImageFile:
+    def _get_template(self, n_rows: int) -> Image.Image:
+        """
+            the static layer of a table, cached per its size. drawing a table copies it and draws only its cells.
+        """
+        cache_key = f'{n_rows}:{self.image_width}:{self.cell_width}x{self.cell_height}:{self.n_cols}'
+        template = self._templates.get(cache_key)
+        if template is None:
+            template = self._draw_template(n_rows)
+            self._templates.set(cache_key, template)
+        return template
+
+    def _draw_template(self, n_rows: int) -> Image.Image:
+        image_height = (n_rows + 2) * self.cell_height
+        image = Image.new("RGB", (self.image_width, image_height), "white")
+        draw = ImageDraw.Draw(image)
+        farsi_font = self.asset_cache.get_font(self.farsi_font_path, 15)
+
+        draw.rectangle([0, 0, self.image_width / 2, self.cell_height], fill=HEADER_BG_COLOR)
+        draw.rectangle([self.image_width / 2, 0, self.image_width, self.cell_height], fill=HEADER_BG_COLOR)
+
+        # Draw table headers
+        for col in range(self.n_cols):
+            x1 = col * self.cell_width
+            y1 = self.cell_height
+            x2 = (col + 1) * self.cell_width
+            y2 = 2 * self.cell_height
+            draw.rectangle([x1, y1, x2, y2], fill=HEADER_BG_COLOR, outline=BORDER_COLOR)
+            self._draw_cell_text(draw, arabic_reshaper.reshape(HEADERS[col]), farsi_font, x1, y1)
+
+        # Draw the backgrounds of table rows
+        for row in range(1, n_rows + 1):
+            bg_color = ROW_BG_COLOR_1 if row % 2 == 1 else ROW_BG_COLOR_2
+            for col in range(self.n_cols):
+                x1 = col * self.cell_width
+                y1 = (row + 1) * self.cell_height
+                x2 = (col + 1) * self.cell_width
+                y2 = (row + 2) * self.cell_height
+                draw.rectangle([x1, y1, x2, y2], fill=bg_color, outline=BORDER_COLOR)
+        return image
+
+    def _draw_cell_text(self, draw: ImageDraw.ImageDraw, cell_text: str, font, x1: float, y1: float):
+        bbox = draw.textbbox((0, 0), cell_text, font=font)
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        text_x = x1 + (self.cell_width - text_width) / 2
+        text_y = y1 + (self.cell_height - text_height) / 2
+        draw.text((text_x, text_y), cell_text, fill=TEXT_COLOR, font=font)
+
+    def _get_icon_path(self, currency_code: str) -> str:
         if '_' in currency_code:
             currency_code = currency_code.split('_')[0]
         file = self.country_mappings.get(currency_code) or self.country_mappings["default"]
-        filename = './png250px/' + file + '.png'
+        return self.icons_directory + file + '.png'
 
-        icon = Image.open(filename)
 
-        return icon
+_worker_generator: Optional[CurrencyImageGeneratorService] = None
+
+
+def _init_worker(generator_kwargs: dict):
+    global _worker_generator
+    _worker_generator = CurrencyImageGeneratorService(**generator_kwargs)
+    _worker_generator.warm_up()
+
+
+def _draw_in_worker(name: str, date: str, rows: List[_TableRow]) -> bytes:
+    return _worker_generator._draw(name, date, rows)
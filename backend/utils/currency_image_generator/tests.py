@@ -1,6 +1,22 @@
+import logging
+import os
+import tempfile
+import time
+from io import BytesIO
+from unittest import TestCase as UnitTestCase, skipUnless
+from unittest.mock import patch
+
 from django.test import TestCase
+from PIL import Image, ImageFont
+
 from runner.bootstrap import get_bootstrapper
+from utils.cache.services import LocalLRUCache
+from utils.date_time.services import DateTimeUtils
+from utils.number_formatter.services import NumberFormatter
 from . import interfaces
+from .services import CurrencyImageGeneratorService, ImageAssetCache
+
+logger = logging.getLogger(__name__)
 
 
 class ImageGeneratorTestCase(TestCase):
@@ -43,3 +59,201 @@ class ImageGeneratorTestCase(TestCase):
         )
         image = self.service.draw_rows_in_picture(data_rows=request)
         # todo: assertions
+
+
+class CurrencyImageGeneratorTestCase(UnitTestCase):
+    def setUp(self):
+        self.icons_directory = tempfile.TemporaryDirectory()
+        for file, color in {'us': 'blue', 'ir': 'green', 'default': 'red'}.items():
+            Image.new('RGBA', (250, 150), color).save(os.path.join(self.icons_directory.name, f'{file}.png'))
+
+    def tearDown(self):
+        self.icons_directory.cleanup()
+
+    @staticmethod
+    def _get_request(rows_count: int = 3, timestamp: int = 1720709075000, balance: int = 111):
+        return interfaces.CurrencyRowList(
+            rows=[
+                interfaces.CurrencyRow(
+                    currency_symbol=["USD", "IRR", "TRY"][i % 3],
+                    balance=i * balance,
+                    status=f"status{i}",
+                ) for i in range(rows_count)
+            ],
+            name="Delkhahi",
+            timestamp=timestamp,
+        )
+
+    def _get_service(self, **kwargs) -> CurrencyImageGeneratorService:
+        return CurrencyImageGeneratorService(**{
+            'english_font_path': 'english.ttf',
+            'farsi_font_path': 'farsi.ttf',
+            'country_mappings': {"USD": "us", "IRR": "ir", "default": "default"},
+            'date_time_utils': DateTimeUtils(),
+            'number_formatter': NumberFormatter(),
+            'asset_cache': ImageAssetCache(),
+            'icons_directory': self.icons_directory.name + '/',
+            **kwargs,
+        })
+
+
+class ImageAssetCacheTestCase(CurrencyImageGeneratorTestCase):
+    @staticmethod
+    def _get_font_loads(truetype) -> list:
+        # the fonts are missing here, so ImageFont.load_default loads its own from memory
+        return sorted(call.args for call in truetype.call_args_list if isinstance(call.args[0], str))
+
+    def test_loads_assets_once_across_renders(self):
+        service = self._get_service()
+
+        with patch.object(ImageFont, 'truetype', wraps=ImageFont.truetype) as truetype, \
+                patch.object(Image, 'open', wraps=Image.open) as open_image:
+            for timestamp in range(1720709075000, 1720709075000 + 5 * 60000, 60000):
+                service.draw_rows_in_picture(self._get_request(rows_count=6, timestamp=timestamp))
+
+        self.assertEqual(self._get_font_loads(truetype), [('english.ttf', 15), ('farsi.ttf', 15)])
+        # TRY has no mapping and shares the default flag
+        self.assertEqual(
+            sorted(os.path.basename(call.args[0]) for call in open_image.call_args_list),
+            ['default.png', 'ir.png', 'us.png'],
+        )
+
+    def test_loads_an_icon_once_per_size(self):
+        asset_cache = ImageAssetCache()
+        icon_path = os.path.join(self.icons_directory.name, 'us.png')
+
+        with patch.object(Image, 'open', wraps=Image.open) as open_image:
+            for size in [(60, 30), (60, 30), (30, 15), (60, 30)]:
+                icon, icon_mask = asset_cache.get_icon(icon_path, size)
+                self.assertEqual(icon.size, size)
+                self.assertEqual(icon_mask.mode, 'L')
+
+        self.assertEqual(open_image.call_count, 2)
+
+    def test_evicts_the_least_recently_used_assets(self):
+        asset_cache = ImageAssetCache(max_fonts=1, max_icons=2)
+        us, ir, default = (os.path.join(self.icons_directory.name, f'{file}.png') for file in ('us', 'ir', 'default'))
+
+        with patch.object(Image, 'open', wraps=Image.open) as open_image:
+            for icon_path in [us, ir, us, default, us, ir]:
+                asset_cache.get_icon(icon_path, (60, 30))
+
+        # ir is evicted by default, us is used again before it and stays
+        self.assertEqual([call.args[0] for call in open_image.call_args_list], [us, ir, default, ir])
+
+        with patch.object(ImageFont, 'truetype', wraps=ImageFont.truetype) as truetype:
+            for size in [15, 20, 15]:
+                asset_cache.get_font('english.ttf', size)
+
+        self.assertEqual(
+            self._get_font_loads(truetype), [('english.ttf', 15), ('english.ttf', 15), ('english.ttf', 20)]
+        )
+
+
+class RenderCacheTestCase(CurrencyImageGeneratorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.render_cache = LocalLRUCache(max_size=10)
+        self.service = self._get_service(render_cache=self.render_cache)
+
+    def test_equal_tables_in_the_same_minute_hit(self):
+        with patch.object(self.service, '_draw', wraps=self.service._draw) as draw:
+            first = self.service.draw_rows_in_picture(self._get_request(timestamp=1720709075000))
+            second = self.service.draw_rows_in_picture(self._get_request(timestamp=1720709084000))
+
+        self.assertEqual(draw.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.render_cache), 1)
+
+    def test_changed_table_misses(self):
+        with patch.object(self.service, '_draw', wraps=self.service._draw) as draw:
+            first = self.service.draw_rows_in_picture(self._get_request())
+            changed_row = self.service.draw_rows_in_picture(self._get_request(balance=222))
+            next_minute = self.service.draw_rows_in_picture(self._get_request(timestamp=1720709135000))
+
+        self.assertEqual(draw.call_count, 3)
+        self.assertNotEqual(first, changed_row)
+        self.assertNotEqual(first, next_minute)
+
+    def test_changed_layout_misses(self):
+        wide = self._get_service(render_cache=self.render_cache, image_width=1000, cell_width=250)
+
+        first = self.service.draw_rows_in_picture(self._get_request())
+        with patch.object(wide, '_draw', wraps=wide._draw) as draw:
+            second = wide.draw_rows_in_picture(self._get_request())
+
+        self.assertEqual(draw.call_count, 1)
+        self.assertNotEqual(first, second)
+        self.assertEqual(Image.open(BytesIO(second)).width, 1000)
+
+
+class DrawManyTestCase(CurrencyImageGeneratorTestCase):
+    def setUp(self):
+        super().setUp()
+        # the third and the fifth tables repeat the first and the second ones
+        self.requests = [self._get_request(balance=balance) for balance in (111, 222, 111, 333, 222)]
+        self.expected = [self._get_service().draw_rows_in_picture(request) for request in self.requests]
+
+    def _assert_draws_many(self, workers_count: int):
+        service = self._get_service(workers_count=workers_count)
+        self.addCleanup(service.close)
+        if workers_count:
+            pool = service._get_pool()
+            draw = patch.object(pool, 'submit', wraps=pool.submit)
+        else:
+            draw = patch.object(service, '_draw', wraps=service._draw)
+
+        with draw as draw_mock:
+            drawn = list(service.iter_draw_many(self.requests))
+
+        self.assertEqual(draw_mock.call_count, 3)
+        self.assertEqual(sorted(index for index, _ in drawn), list(range(len(self.requests))))
+        self.assertEqual([image_bytes for _, image_bytes in sorted(drawn)], self.expected)
+        self.assertEqual(service.draw_many(self.requests), self.expected)
+
+    def test_draw_many_on_the_calling_thread(self):
+        self._assert_draws_many(workers_count=0)
+
+    def test_draw_many_in_worker_processes(self):
+        self._assert_draws_many(workers_count=2)
+
+
+class TemplateDrawingTestCase(CurrencyImageGeneratorTestCase):
+    def test_template_drawing_equals_full_drawing(self):
+        for cell_height in (50, 30):
+            full = self._get_service(use_templates=False, cell_height=cell_height)
+            templated = self._get_service(use_templates=True, cell_height=cell_height)
+
+            image_bytes = templated.draw_rows_in_picture(self._get_request(rows_count=5))
+
+            self.assertEqual(full.draw_rows_in_picture(self._get_request(rows_count=5)), image_bytes)
+            self.assertEqual(Image.open(BytesIO(image_bytes)).height, 7 * cell_height)
+
+
+@skipUnless(os.getenv('RUN_BENCHMARKS'), 'a manual benchmark, set RUN_BENCHMARKS to run it')
+class TemplateDrawingBenchmarkTestCase(CurrencyImageGeneratorTestCase):
+    renders_count = 50
+    rounds_count = 3
+
+    def setUp(self):
+        super().setUp()
+        self.request = self._get_request(rows_count=30)
+
+    def _measure(self, service: CurrencyImageGeneratorService) -> float:
+        service.draw_rows_in_picture(self.request)
+        throughputs = []
+        for _ in range(self.rounds_count):
+            started = time.perf_counter()
+            for _ in range(self.renders_count):
+                service.draw_rows_in_picture(self.request)
+            throughputs.append(self.renders_count / (time.perf_counter() - started))
+        # the best round is the least disturbed by the rest of the machine
+        return max(throughputs)
+
+    def test_template_drawing_throughput(self):
+        full, templated = self._get_service(use_templates=False), self._get_service(use_templates=True)
+
+        full_throughput, templated_throughput = self._measure(full), self._measure(templated)
+        logger.info(f'full drawing: {full_throughput:.1f} images/s, '
+                    f'template drawing: {templated_throughput:.1f} images/s')
+        self.assertGreaterEqual(templated_throughput, full_throughput)
@@ -1,5 +1,7 @@
 import abc
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
 from pydantic import BaseModel
 
 
@@ -7,6 +9,8 @@ class RequesterResponse(BaseModel):
     status_code: int
     content_bytes: bytes = None
     content_json: object = None
+    # lower-cased header names
+    headers: Dict[str, str] = {}
 
 
 class RequestException(Exception):
@@ -53,3 +57,14 @@ class AbstractHTTPRequester(abc.ABC):
 
     def delete(self, *args, **kwargs):
         return self.request('DELETE', *args, **kwargs)
+
+    async def arequest(self, *args, **kwargs) -> RequesterResponse:
+        """the async version of request, runs request in a thread unless an implementation has an async client
+        """
+        return await sync_to_async(self.request, thread_sensitive=False)(*args, **kwargs)
+
+    async def aget(self, *args, **kwargs):
+        return await self.arequest('GET', *args, **kwargs)
+
+    async def apost(self, *args, **kwargs):
+        return await self.arequest('POST', *args, **kwargs)
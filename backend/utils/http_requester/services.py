@@ -1,13 +1,84 @@
-from typing import List, Tuple
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import weakref
+from collections.abc import AsyncIterable, Iterable, Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional, Tuple
 from urllib.parse import urljoin
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 import logging
+from utils.cache import interfaces as cache_interfaces
 from . import interfaces
 
 logger = logging.getLogger(__name__)
 
+# a hedged request may reach more than one address, so only methods that are safe to repeat are hedged
+HEDGED_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class CircuitBreaker:
+    """
+        opens the circuit of an address after failure_threshold consecutive failures. an open address is skipped
+        for reset_timeout seconds, then a single request may try it again and its result closes or reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def is_available(self, address: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(address)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at < self.reset_timeout:
+                return False
+            # half open, the next requests wait for another period unless this one succeeds
+            self._opened_at[address] = time.monotonic()
+            return True
+
+    def record_success(self, address: str):
+        with self._lock:
+            self._failures.pop(address, None)
+            self._opened_at.pop(address, None)
+
+    def record_failure(self, address: str):
+        with self._lock:
+            self._failures[address] = self._failures.get(address, 0) + 1
+            if self._failures[address] >= self.failure_threshold:
+                if address not in self._opened_at:
+                    logger.warning(f"circuit of {address} opened after {self._failures[address]} failures")
+                self._opened_at[address] = time.monotonic()
+
 
 class RequestsHTTPRequester(interfaces.AbstractHTTPRequester):
+    """
+        tries base_addresses in turn, skipping the ones whose circuit is open while another one is available.
+        with hedge_delay (seconds) an idempotent request does not wait for a slow address: the next address is
+        tried after hedge_delay, or as soon as the current attempts fail, and the first non to-retry response wins.
+    """
+
+    def __init__(
+            self,
+            hedge_delay: Optional[float] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            hedge_workers: int = 10,
+    ):
+        self.hedge_delay = hedge_delay
+        self.circuit_breaker = circuit_breaker
+        self.hedge_workers = hedge_workers
+        # the pool starts its threads on the first hedged request, creating it here keeps it single
+        self._executor = ThreadPoolExecutor(
+            max_workers=hedge_workers, thread_name_prefix='hedged-request'
+        ) if hedge_delay is not None else None
 
     def request(self, method: str, base_addresses: List[str], path: str, data=None, retry_statuses: List[int] = None,
                 parse_response_as_json: bool = True, timeout: Tuple[int, int] = (10, 301), **kwargs) -> interfaces.RequesterResponse:
@@ -16,39 +87,98 @@ class RequestsHTTPRequester(interfaces.AbstractHTTPRequester):
                     f"timeout:{timeout},kwargs:{kwargs}")
         if retry_statuses is None:
             retry_statuses = [500, 502, 503, 504]
-        for base_address in base_addresses:
-            the_url = urljoin(base_address, path)
-            logger.debug(f"the url is: url: {the_url}")
-
-            response = requests.request(
-                method=method,
-                url=the_url,
-                data=data,
-                timeout=timeout,
-                params=kwargs.get("params", None),
-                headers=kwargs.get("headers", None),
+
+        def attempt(base_address: str):
+            return self._attempt(
+                base_address, retry_statuses, method=method, path=path, data=data, timeout=timeout, **kwargs
             )
-            if response.status_code not in retry_statuses:
-                break
+
+        addresses = self._get_addresses(base_addresses)
+        if self.hedge_delay is not None and method.upper() in HEDGED_METHODS and len(addresses) > 1:
+            response = self._request_hedged(addresses, attempt)
         else:
+            response = next((r for r in map(attempt, addresses) if r is not None), None)
+        if response is None:
             raise interfaces.RequestException(
                 status_code=500,
                 message="None of base addresses returned a non to-retry response"
             )
 
+        result = self._convert_response(response, parse_response_as_json)
+        logger.info(f"result:{result}")
+        return result
+
+    def _get_addresses(self, base_addresses: List[str]) -> List[str]:
+        if self.circuit_breaker is None:
+            return list(base_addresses)
+        # when every circuit is open all addresses are tried anyway
+        return [a for a in base_addresses if self.circuit_breaker.is_available(a)] or list(base_addresses)
+
+    def _attempt(self, base_address: str, retry_statuses: List[int], method: str, path: str, **kwargs):
+        the_url = urljoin(base_address, path)
+        logger.debug(f"the url is: url: {the_url}")
+        try:
+            response = self._send(method=method, url=the_url, **kwargs)
+        except TypeError:
+            # a request that can not be built fails the same on every address
+            raise
+        except Exception as e:
+            logger.warning(f"request to {the_url} failed: {e}")
+            response = None
+        return self._check_response(base_address, response, retry_statuses)
+
+    def _check_response(self, base_address: str, response, retry_statuses: List[int]):
+        failed = response is None or response.status_code in retry_statuses
+        if self.circuit_breaker is not None:
+            if failed:
+                self.circuit_breaker.record_failure(base_address)
+            else:
+                self.circuit_breaker.record_success(base_address)
+        return None if failed else response
+
+    def _request_hedged(self, addresses: List[str], attempt):
+        remaining = iter(addresses)
+        pending = set()
+        while True:
+            base_address = next(remaining, None)
+            if base_address is not None:
+                pending.add(self._executor.submit(attempt, base_address))
+            if not pending:
+                return None
+            # once every address is fired only the pending attempts are awaited
+            done, pending = wait(
+                pending, timeout=self.hedge_delay if base_address is not None else None, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future.result() is not None:
+                    # the slower attempts finish in the background and are dropped
+                    return future.result()
+
+    def _send(self, method: str, url: str, data, timeout: Tuple[int, int], **kwargs):
+        return requests.request(
+            method=method,
+            url=url,
+            data=data,
+            timeout=timeout,
+            params=kwargs.get("params", None),
+            headers=kwargs.get("headers", None),
+        )
+
+    @staticmethod
+    def _convert_response(response, parse_response_as_json: bool) -> interfaces.RequesterResponse:
         content_json = None
         if parse_response_as_json:
             try:
                 content_json = response.json()
-            except requests.exceptions.JSONDecodeError as e:
+            except ValueError as e:
+                # requests and httpx both raise subclasses of ValueError for a non-json body
                 logger.debug(e)
-        result = interfaces.RequesterResponse(
+        return interfaces.RequesterResponse(
             status_code=response.status_code,
             content_bytes=response.content,
             content_json=content_json,
+            headers={key.lower(): value for key, value in response.headers.items()},
         )
-        logger.info(f"result:{result}")
-        return result
 
     def get(self, *args, **kwargs):
         return self.request('GET', *args, **kwargs)
@@ -60,4 +190,305 @@ class RequestsHTTPRequester(interfaces.AbstractHTTPRequester):
         return self.request('PATCH', *args, **kwargs)
 
     def put(self, *args, **kwargs):
-        return self.request('PUT', *args, **kwargs)
\ No newline at end of file
+        return self.request('PUT', *args, **kwargs)
+
+
+class SessionHTTPRequester(RequestsHTTPRequester):
+    """
+        sends through one requests.Session, so connections to a host are kept alive and reused from a pool
+        instead of a new tcp and tls handshake per request.
+        pool_connections is the number of hosts to keep pools for and pool_maxsize the connections of each one,
+        which should not be less than the threads using the requester concurrently.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, keep_alive: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def _send(self, method: str, url: str, data, timeout: Tuple[int, int], **kwargs):
+        return self.session.request(
+            method=method,
+            url=url,
+            data=data,
+            timeout=timeout,
+            params=kwargs.get("params", None),
+            headers=kwargs.get("headers", None),
+        )
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxHTTPRequester(RequestsHTTPRequester):
+    """
+        pooled requester on httpx with a native arequest. the sync and async clients are created on first use,
+        the async ones once per event loop since their connections belong to the loop that opened them.
+    """
+
+    def __init__(
+            self,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 5.0,
+            **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client = None
+        # a loop running in another thread keeps using its own client, so the clients are keyed by loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_clients_lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(limits=self.limits)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            async_client = self._async_clients.get(loop)
+            if async_client is None:
+                # the connections of a closed loop can not be used nor closed from another one, they are dropped
+                for closed_loop in [key for key in self._async_clients if key.is_closed()]:
+                    del self._async_clients[closed_loop]
+                async_client = httpx.AsyncClient(limits=self.limits)
+                self._async_clients[loop] = async_client
+        return async_client
+
+    @staticmethod
+    def _get_request_kwargs(data, timeout: Tuple[int, int], **kwargs) -> dict:
+        connect_timeout, read_timeout = timeout
+        # httpx takes form fields as data and raw or streamed bodies as content
+        if data is None:
+            body = {}
+        elif isinstance(data, Mapping):
+            body = dict(data=data)
+        elif isinstance(data, (str, bytes, Iterable, AsyncIterable)):
+            body = dict(content=data)
+        else:
+            raise TypeError(f"unsupported request body of type {type(data).__name__}")
+        return dict(
+            **body,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            params=kwargs.get("params", None),
+            headers=kwargs.get("headers", None),
+        )
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        with self._async_clients_lock:
+            async_client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if async_client is not None:
+            await async_client.aclose()
+
+    def _send(self, method: str, url: str, data, timeout: Tuple[int, int], **kwargs):
+        return self.client.request(method=method, url=url, **self._get_request_kwargs(data, timeout, **kwargs))
+
+    async def _asend(self, method: str, url: str, data, timeout: Tuple[int, int], **kwargs):
+        return await self.async_client.request(
+            method=method, url=url, **self._get_request_kwargs(data, timeout, **kwargs)
+        )
+
+    async def arequest(self, method: str, base_addresses: List[str], path: str, data=None,
+                       retry_statuses: List[int] = None, parse_response_as_json: bool = True,
+                       timeout: Tuple[int, int] = (10, 301), **kwargs) -> interfaces.RequesterResponse:
+        logger.info(f"method:{method},base_addresses:{base_addresses},path:{path},data:{data},"
+                    f"retry_statuses:{retry_statuses},parse_response_as_json:{parse_response_as_json},"
+                    f"timeout:{timeout},kwargs:{kwargs}")
+        if retry_statuses is None:
+            retry_statuses = [500, 502, 503, 504]
+
+        async def attempt(base_address: str):
+            return await self._aattempt(
+                base_address, retry_statuses, method=method, path=path, data=data, timeout=timeout, **kwargs
+            )
+
+        addresses = self._get_addresses(base_addresses)
+        if self.hedge_delay is not None and method.upper() in HEDGED_METHODS and len(addresses) > 1:
+            response = await self._arequest_hedged(addresses, attempt)
+        else:
+            response = None
+            for base_address in addresses:
+                response = await attempt(base_address)
+                if response is not None:
+                    break
+        if response is None:
+            raise interfaces.RequestException(
+                status_code=500,
+                message="None of base addresses returned a non to-retry response"
+            )
+
+        result = self._convert_response(response, parse_response_as_json)
+        logger.info(f"result:{result}")
+        return result
+
+    async def _aattempt(self, base_address: str, retry_statuses: List[int], method: str, path: str, **kwargs):
+        the_url = urljoin(base_address, path)
+        logger.debug(f"the url is: url: {the_url}")
+        try:
+            response = await self._asend(method=method, url=the_url, **kwargs)
+        except TypeError:
+            # a request that can not be built fails the same on every address
+            raise
+        except Exception as e:
+            logger.warning(f"request to {the_url} failed: {e}")
+            response = None
+        return self._check_response(base_address, response, retry_statuses)
+
+    async def _arequest_hedged(self, addresses: List[str], attempt):
+        remaining = iter(addresses)
+        pending = set()
+        try:
+            while True:
+                base_address = next(remaining, None)
+                if base_address is not None:
+                    pending.add(asyncio.create_task(attempt(base_address)))
+                if not pending:
+                    return None
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if base_address is not None else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class CachingHTTPRequester(interfaces.AbstractHTTPRequester):
+    """
+        wraps a requester and caches the 200 responses of GET requests as their Cache-Control allows.
+        a fresh response is returned without a request, a stale one with an ETag or Last-Modified is revalidated
+        with a conditional request and reused on 304. responses without max-age are cached for default_max_age
+        seconds, and kept for revalidation for revalidation_timeout seconds. the size of the cache bounds the
+        number of cached responses.
+    """
+
+    def __init__(
+            self,
+            requester: interfaces.AbstractHTTPRequester,
+            cache: cache_interfaces.AbstractCache,
+            default_max_age: int = 0,
+            revalidation_timeout: int = 60 * 60,
+    ):
+        self.requester = requester
+        self.cache = cache
+        self.default_max_age = default_max_age
+        self.revalidation_timeout = revalidation_timeout
+
+    def request(self, method: str, base_addresses: List[str], path: str, data=None,
+                **kwargs) -> interfaces.RequesterResponse:
+        if method.upper() != 'GET' or data is not None:
+            return self.requester.request(method, base_addresses, path, data=data, **kwargs)
+
+        cache_key = self._get_cache_key(base_addresses, path, kwargs)
+        entry = self.cache.get(cache_key)
+        if entry and entry['expires_at'] > time.time():
+            logger.info(f"cache hit: {path}")
+            return entry['response']
+        response = self.requester.request(
+            method, base_addresses, path, **{**kwargs, 'headers': self._get_conditional_headers(entry, kwargs)}
+        )
+        response, new_entry, timeout = self._get_new_entry(entry, response)
+        if new_entry:
+            self.cache.set(cache_key, new_entry, timeout=timeout)
+        elif entry:
+            self.cache.delete(cache_key)
+        return response
+
+    async def arequest(self, method: str, base_addresses: List[str], path: str, data=None,
+                       **kwargs) -> interfaces.RequesterResponse:
+        if method.upper() != 'GET' or data is not None:
+            return await self.requester.arequest(method, base_addresses, path, data=data, **kwargs)
+
+        cache_key = self._get_cache_key(base_addresses, path, kwargs)
+        entry = await self.cache.aget(cache_key)
+        if entry and entry['expires_at'] > time.time():
+            logger.info(f"cache hit: {path}")
+            return entry['response']
+        response = await self.requester.arequest(
+            method, base_addresses, path, **{**kwargs, 'headers': self._get_conditional_headers(entry, kwargs)}
+        )
+        response, new_entry, timeout = self._get_new_entry(entry, response)
+        if new_entry:
+            await self.cache.aset(cache_key, new_entry, timeout=timeout)
+        elif entry:
+            await self.cache.adelete(cache_key)
+        return response
+
+    @staticmethod
+    def _get_cache_key(base_addresses: List[str], path: str, kwargs: dict) -> str:
+        # the response may differ by the parsing flag, params and headers too
+        key = json.dumps(
+            [base_addresses, path, kwargs.get('params'), kwargs.get('headers'), kwargs.get('parse_response_as_json')],
+            sort_keys=True,
+            default=str,
+        )
+        return f"http_response_{hashlib.sha256(key.encode()).hexdigest()}"
+
+    @staticmethod
+    def _get_conditional_headers(entry: Optional[dict], kwargs: dict) -> Optional[dict]:
+        headers = kwargs.get('headers')
+        if not entry:
+            return headers
+        headers = dict(headers or {})
+        cached_headers = entry['response'].headers
+        if 'etag' in cached_headers:
+            headers['If-None-Match'] = cached_headers['etag']
+        if 'last-modified' in cached_headers:
+            headers['If-Modified-Since'] = cached_headers['last-modified']
+        return headers
+
+    @staticmethod
+    def _parse_cache_control(value: str) -> dict:
+        directives = {}
+        for directive in value.split(','):
+            name, _, argument = directive.strip().partition('=')
+            if name:
+                directives[name.lower()] = argument.strip('"')
+        return directives
+
+    def _get_new_entry(self, entry: Optional[dict], response: interfaces.RequesterResponse):
+        """
+            returns the response to return, the cache entry to store for it, None if it should not be cached,
+            and the timeout of the entry
+        """
+        if response.status_code == 304 and entry:
+            logger.info(f"revalidated: {entry['response']}")
+            # a 304 carries the new freshness of the cached response
+            headers = {**entry['response'].headers, **response.headers}
+            response = entry['response'].model_copy(update={'headers': headers})
+        if response.status_code != 200:
+            return response, None, 0
+
+        directives = self._parse_cache_control(response.headers.get('cache-control', ''))
+        if 'no-store' in directives:
+            return response, None, 0
+        try:
+            max_age = 0 if 'no-cache' in directives else int(directives.get('max-age', self.default_max_age))
+        except ValueError:
+            max_age = 0
+        can_revalidate = 'etag' in response.headers or 'last-modified' in response.headers
+        if max_age <= 0 and not can_revalidate:
+            return response, None, 0
+        new_entry = {'response': response, 'expires_at': time.time() + max_age}
+        return response, new_entry, max(max_age, self.revalidation_timeout if can_revalidate else 0)
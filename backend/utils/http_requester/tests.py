@@ -0,0 +1,197 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from . import interfaces
+from utils.cache.services import LocalLRUCache
+from .services import CachingHTTPRequester, CircuitBreaker, HttpxHTTPRequester, RequestsHTTPRequester, SessionHTTPRequester
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections_count += 1
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path.startswith('/slow'):
+            time.sleep(1)
+        if self.path.startswith('/etag') and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        status = 503 if self.path.startswith('/down') else 200
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.path.startswith('/max-age'):
+            self.send_header('Cache-Control', 'max-age=60')
+        if self.path.startswith('/etag'):
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.paths.append(self.path)
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            received = b''
+            while chunk_size := int(self.rfile.readline(), 16):
+                received += self.rfile.read(chunk_size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            received = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'path': self.path, 'body': received.decode()}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPRequesterTestCase(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.connections_count = 0
+        self.server.paths = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_address = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_requester_connects_per_request(self):
+        requester = RequestsHTTPRequester()
+        for _ in range(3):
+            self.assertEqual(requester.get([self.base_address], 'books').content_json, {'path': '/books'})
+        self.assertEqual(self.server.connections_count, 3)
+
+    def test_session_requester_reuses_connection(self):
+        requester = SessionHTTPRequester()
+        for _ in range(3):
+            self.assertEqual(requester.get([self.base_address], 'books').content_json, {'path': '/books'})
+        requester.close()
+        self.assertEqual(self.server.connections_count, 1)
+
+    def test_httpx_requester_async(self):
+        requester = HttpxHTTPRequester()
+
+        async def request():
+            return [await requester.aget([self.base_address], 'books') for _ in range(3)]
+
+        results = asyncio.run(request())
+        self.assertEqual([result.content_json for result in results], [{'path': '/books'}] * 3)
+        self.assertEqual(self.server.connections_count, 1)
+
+    def test_httpx_requester_forwards_every_body(self):
+        requester = HttpxHTTPRequester()
+
+        for data, expected in (
+                ('text', 'text'),
+                (b'bytes', 'bytes'),
+                ([b'chunk-', b'ed'], 'chunk-ed'),
+                ({'name': 'value'}, 'name=value'),
+        ):
+            result = requester.post([self.base_address], 'books', data=data)
+            self.assertEqual(result.content_json['body'], expected)
+        requester.close()
+
+    def test_httpx_requester_reopens_after_close(self):
+        requester = HttpxHTTPRequester()
+        requester.get([self.base_address], 'books')
+
+        requester.close()
+        result = requester.get([self.base_address], 'books')
+
+        self.assertEqual(result.content_json, {'path': '/books'})
+        self.assertEqual(self.server.connections_count, 2)
+        requester.close()
+
+    def test_httpx_requester_rejects_unknown_body(self):
+        requester = HttpxHTTPRequester()
+        with self.assertRaises(TypeError):
+            requester.post([self.base_address], 'books', data=1)
+        self.assertEqual(self.server.paths, [])
+
+    def test_httpx_requester_keeps_a_client_per_loop(self):
+        requester = HttpxHTTPRequester()
+
+        async def request():
+            await requester.aget([self.base_address], 'books')
+            return requester.async_client
+
+        first_client = asyncio.run(request())
+        second_client = asyncio.run(request())
+
+        self.assertIsNot(first_client, second_client)
+        self.assertEqual(len(requester._async_clients), 1)
+
+    def test_retry_statuses(self):
+        requester = SessionHTTPRequester()
+        with self.assertRaises(interfaces.RequestException):
+            requester.get([self.base_address + 'down/', self.base_address + 'down/'], 'books')
+
+    def test_hedged_request_does_not_wait_for_slow_address(self):
+        requester = SessionHTTPRequester(hedge_delay=0.05)
+
+        started = time.perf_counter()
+        result = requester.get([self.base_address + 'slow/', self.base_address + 'fast/'], 'books')
+
+        self.assertEqual(result.content_json, {'path': '/fast/books'})
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_open_circuit_is_skipped(self):
+        requester = SessionHTTPRequester(circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+        addresses = [self.base_address + 'down/', self.base_address + 'up/']
+
+        requester.get(addresses, 'books')
+        result = requester.get(addresses, 'books')
+
+        self.assertEqual(result.content_json, {'path': '/up/books'})
+        self.assertEqual(self.server.paths, ['/down/books', '/up/books', '/up/books'])
+
+    def test_caches_fresh_responses(self):
+        requester = CachingHTTPRequester(requester=SessionHTTPRequester(), cache=LocalLRUCache(max_size=10))
+
+        for _ in range(3):
+            self.assertEqual(requester.get([self.base_address], 'max-age').content_json, {'path': '/max-age'})
+            requester.get([self.base_address], 'books')
+
+        self.assertEqual(self.server.paths.count('/max-age'), 1)
+        self.assertEqual(self.server.paths.count('/books'), 3)
+
+    def test_revalidates_with_etag(self):
+        requester = CachingHTTPRequester(requester=SessionHTTPRequester(), cache=LocalLRUCache(max_size=10))
+
+        results = [requester.get([self.base_address], 'etag') for _ in range(2)]
+
+        self.assertEqual([result.content_json for result in results], [{'path': '/etag'}] * 2)
+        self.assertEqual(self.server.paths, ['/etag', '/etag'])
+
+
+class CircuitBreakerTestCase(TestCase):
+    def test_opens_and_half_opens(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure('a')
+        self.assertTrue(breaker.is_available('a'))
+        breaker.record_failure('a')
+        self.assertFalse(breaker.is_available('a'))
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.is_available('a'))
+        self.assertFalse(breaker.is_available('a'))
+        breaker.record_success('a')
+        self.assertTrue(breaker.is_available('a'))